@@ -1,11 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
-from .models import AuthToken, Profile
+from .models import AuthToken, OutboxEmail, Profile
 
 admin.site.register(AuthToken)
 
 
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'to', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+
+
 class ProfileInline(admin.StackedInline):
     model = Profile
     exclude = []
@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (64, 250)
+THUMBS_DIR = 'user_pics/thumbs'
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'AVATAR_WORKERS', 2))
+    return _executor
+
+
+def get_thumbnail_format():
+    from PIL import features
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def get_thumbnail_name(digest, size, extension):
+    return f'{THUMBS_DIR}/{digest}_{size}.{extension}'
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def render_thumbnails(source, media_root, sizes=AVATAR_SIZES):
+    # Выполняется в отдельном процессе, поэтому не трогает ни модели, ни базу.
+    # Имена миниатюр зависят от содержимого файла: одинаковые загрузки
+    # не пересчитываются, а старые ссылки можно кэшировать навсегда.
+    from PIL import Image, ImageOps
+    digest = file_digest(source)
+    image_format, extension = get_thumbnail_format()
+    os.makedirs(os.path.join(media_root, THUMBS_DIR), exist_ok=True)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sizes:
+            path = os.path.join(media_root, get_thumbnail_name(digest, size, extension))
+            if os.path.exists(path):
+                continue
+            thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            thumbnail.save(tmp_path, image_format, quality=82, optimize=True)
+            os.replace(tmp_path, path)
+    return f'{digest}.{extension}'
+
+
+def schedule_thumbnails(profile):
+    if not profile.avatar:
+        return
+    source = profile.avatar.path
+    avatar_name = profile.avatar.name
+    profile_pk = profile.pk
+
+    def submit():
+        future = get_executor().submit(render_thumbnails, source, settings.MEDIA_ROOT)
+        future.add_done_callback(lambda f: thumbnails_done(f, profile_pk, avatar_name))
+
+    transaction.on_commit(submit)
+
+
+def thumbnails_done(future, profile_pk, avatar_name):
+    from accounts.models import Profile
+    try:
+        avatar_thumbs = future.result()
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры аватара профиля %s', profile_pk)
+        return
+    # колбэк работает в служебном потоке пула: своё соединение с базой закрываем сами
+    try:
+        Profile.objects.filter(pk=profile_pk, avatar=avatar_name).update(avatar_thumbs=avatar_thumbs)
+    finally:
+        connection.close()
+
+
+def get_avatar_url(profile, size):
+    if not profile or not profile.avatar:
+        return ''
+    if profile.avatar_thumbs:
+        digest, extension = profile.avatar_thumbs.split('.')
+        sizes = [s for s in AVATAR_SIZES if s >= size] or [max(AVATAR_SIZES)]
+        return settings.MEDIA_URL + get_thumbnail_name(digest, min(sizes), extension)
+    return profile.avatar.url
@@ -6,7 +6,8 @@ from django.conf import settings
 from django import forms
 from django.contrib.auth import get_user_model
 
-from .models import AuthToken, Profile, TOKEN_TYPE_PASSWORD_RESET
+from .models import OutboxEmail, Profile, TOKEN_TYPE_PASSWORD_RESET
+from .tokens import create_token
 
 
 class MyUserCreationForm(UserCreationForm):
@@ -33,7 +34,7 @@ class MyUserCreationForm(UserCreationForm):
     #     return user
 
     def create_token(self, user):
-        return AuthToken.objects.create(user=user)
+        return create_token(user)
 
     def send_email(self, user, token):
         if user.email:
@@ -47,10 +48,7 @@ class MyUserCreationForm(UserCreationForm):
 Вы создали учётную запись на сайте "Мой Блог"
 Активируйте её, перейдя по ссылке <a href="{link}">{link}</a>.
 Если вы считаете, что это ошибка, просто игнорируйте это письмо.'''
-            try:
-                user.email_user(subject, message, html_message=html_message)
-            except Exception as e:
-                print(e)
+            OutboxEmail.enqueue(user.email, subject, message, html_message=html_message)
 
 
 class UserChangeForm(forms.ModelForm):
@@ -117,7 +115,7 @@ class PasswordResetEmailForm(forms.Form):
         User = get_user_model()
         email = self.cleaned_data.get('email')
         user = User.objects.filter(email=email).first()
-        token = AuthToken.objects.create(user=user, life_days=3, type=TOKEN_TYPE_PASSWORD_RESET)
+        token = create_token(user, life_days=3, type=TOKEN_TYPE_PASSWORD_RESET)
 
         subject = 'Вы запросили восстановление пароля для учётной записи на сайте "Мой Блог"'
         link = settings.BASE_HOST + reverse('accounts:password_reset', kwargs={'token': token.token})
@@ -125,10 +123,7 @@ class PasswordResetEmailForm(forms.Form):
 Если вы считаете, что это ошибка, просто игнорируйте это письмо.'''
         html_message = f'''Ваша ссылка для восстановления пароля: <a href="{link}">{link}</a>.
 Если вы считаете, что это ошибка, просто игнорируйте это письмо.'''
-        try:
-            user.email_user(subject, message, html_message=html_message)
-        except Exception as e:
-            print(e)
+        OutboxEmail.enqueue(user.email, subject, message, html_message=html_message)
 
 
 class PasswordResetForm(SetPasswordForm):
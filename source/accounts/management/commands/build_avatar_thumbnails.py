@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.avatars import render_thumbnails
+from accounts.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры для аватаров, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Пересчитать и уже готовые')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['all']:
+            profiles = profiles.filter(avatar_thumbs__isnull=True)
+        done = 0
+        for profile in profiles.only('pk', 'avatar').iterator():
+            try:
+                avatar_thumbs = render_thumbnails(profile.avatar.path, settings.MEDIA_ROOT)
+            except Exception as e:
+                self.stderr.write(f'{profile.pk}: {e}')
+                continue
+            Profile.objects.filter(pk=profile.pk).update(avatar_thumbs=avatar_thumbs)
+            done += 1
+        self.stdout.write(f'Готово: {done}')
@@ -0,0 +1,74 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+
+from accounts.models import OutboxEmail, OUTBOX_STATUS_PENDING
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди OutboxEmail пачками через одно SMTP-соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--backoff', type=int, default=60, help='Задержка перед первым повтором, секунд')
+        parser.add_argument('--lease', type=int, default=300, help='На сколько секунд пачка закрепляется за обработчиком')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--sleep', type=float, default=5, help='Пауза при пустой очереди в режиме --loop')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'[:64]
+        sent = failed = 0
+        while True:
+            emails = OutboxEmail.claim(worker, options['batch_size'], timedelta(seconds=options['lease']))
+            if emails:
+                batch_sent, batch_failed = self.send_batch(emails, options)
+                sent += batch_sent
+                failed += batch_failed
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+
+    def send_batch(self, emails, options):
+        sent = failed = 0
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            for email in emails:
+                email.mark_failed(e, options['max_attempts'], options['backoff'])
+            return 0, len(emails)
+        try:
+            for email in emails:
+                if email.status != OUTBOX_STATUS_PENDING:
+                    # уже отправлено или отброшено: повторно не шлём
+                    continue
+                message = EmailMultiAlternatives(email.subject, email.body,
+                                                 email.from_email or settings.DEFAULT_FROM_EMAIL,
+                                                 [email.to], connection=connection)
+                if email.html_body:
+                    message.attach_alternative(email.html_body, 'text/html')
+                try:
+                    message.send()
+                except Exception as e:
+                    email.mark_failed(e, options['max_attempts'], options['backoff'])
+                    failed += 1
+                    # после ошибки состояние соединения неизвестно, открываем новое
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        pass
+                else:
+                    email.mark_sent()
+                    sent += 1
+        finally:
+            connection.close()
+        return sent, failed
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.13 on 2026-10-18 09:29
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='authtoken',
+            name='token',
+            field=models.UUIDField(default=uuid.uuid4, unique=True, verbose_name='Токен'),
+        ),
+    ]
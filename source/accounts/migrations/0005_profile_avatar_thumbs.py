@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_authtoken_token_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_thumbs',
+            field=models.CharField(blank=True, editable=False, max_length=30, null=True, verbose_name='Миниатюры аватара'),
+        ),
+    ]
@@ -15,7 +15,7 @@ TOKEN_TYPE_CHOICES = (
 
 
 class AuthToken(models.Model):
-    token = models.UUIDField(verbose_name='Токен', default=uuid4)
+    token = models.UUIDField(verbose_name='Токен', default=uuid4, unique=True)
     user: AbstractUser = models.ForeignKey(get_user_model(), on_delete=models.CASCADE,
                                            related_name='tokens', verbose_name='Пользователь')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
@@ -41,11 +41,90 @@ class AuthToken(models.Model):
         verbose_name_plural = 'Аутентификационные токены'
 
 
+OUTBOX_STATUS_PENDING = 'pending'
+OUTBOX_STATUS_SENT = 'sent'
+OUTBOX_STATUS_FAILED = 'failed'
+OUTBOX_STATUS_CHOICES = (
+    (OUTBOX_STATUS_PENDING, 'В очереди'),
+    (OUTBOX_STATUS_SENT, 'Отправлено'),
+    (OUTBOX_STATUS_FAILED, 'Ошибка')
+)
+
+
+class OutboxEmail(models.Model):
+    to = models.EmailField(verbose_name='Кому')
+    from_email = models.CharField(max_length=254, null=True, blank=True, verbose_name='От кого')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    html_body = models.TextField(null=True, blank=True, verbose_name='HTML')
+    status = models.CharField(max_length=10, choices=OUTBOX_STATUS_CHOICES, default=OUTBOX_STATUS_PENDING,
+                              verbose_name='Статус')
+    attempts = models.IntegerField(default=0, verbose_name='Попыток')
+    last_error = models.TextField(null=True, blank=True, verbose_name='Последняя ошибка')
+    available_at = models.DateTimeField(default=now, verbose_name='Отправить после')
+    locked_by = models.CharField(max_length=64, null=True, blank=True, verbose_name='Обработчик')
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name='Занято до')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    @classmethod
+    def enqueue(cls, to, subject, message, html_message=None, from_email=None):
+        return cls.objects.create(to=to, subject=subject, body=message, html_body=html_message,
+                                  from_email=from_email)
+
+    @classmethod
+    def claim(cls, worker, batch_size, lease):
+        # Несколько обработчиков не возьмут одно письмо: строки захватываются
+        # условным UPDATE, который проходит только для свободных строк в очереди.
+        # Условия SELECT повторяются в UPDATE: между ними другой обработчик мог
+        # отправить письмо и снять блокировку
+        current = now()
+        ready = (models.Q(locked_until__isnull=True) | models.Q(locked_until__lt=current)) \
+            & models.Q(status=OUTBOX_STATUS_PENDING, available_at__lte=current)
+        ids = list(cls.objects.filter(ready).order_by('available_at', 'pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return []
+        cls.objects.filter(ready, pk__in=ids).update(locked_by=worker, locked_until=current + lease)
+        return list(cls.objects.filter(pk__in=ids, locked_by=worker, status=OUTBOX_STATUS_PENDING).order_by('pk'))
+
+    def mark_sent(self):
+        self.status = OUTBOX_STATUS_SENT
+        self.sent_at = now()
+        self.attempts += 1
+        self.last_error = None
+        self.locked_by = self.locked_until = None
+        self.save(update_fields=['status', 'sent_at', 'attempts', 'last_error', 'locked_by', 'locked_until'])
+
+    def mark_failed(self, error, max_attempts, backoff):
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = OUTBOX_STATUS_FAILED
+        else:
+            # экспоненциальная задержка: backoff, 2 * backoff, 4 * backoff ... не больше суток
+            delay = min(backoff * 2 ** (self.attempts - 1), 60 * 60 * 24)
+            self.available_at = now() + timedelta(seconds=delay)
+        self.locked_by = self.locked_until = None
+        self.save(update_fields=['status', 'attempts', 'last_error', 'available_at', 'locked_by', 'locked_until'])
+
+    def __str__(self):
+        return f'{self.to} - {self.subject}'
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_pending_idx'),
+        ]
+
+
 class Profile(models.Model):
     user: AbstractUser = models.OneToOneField(get_user_model(), related_name='profile',
                                               on_delete=models.CASCADE, verbose_name='Пользователь')
     birth_date = models.DateField(null=True, blank=True, verbose_name='Дата рождения')
     avatar = models.ImageField(null=True, blank=True, upload_to='user_pics', verbose_name='Аватар')
+    avatar_thumbs = models.CharField(max_length=30, null=True, blank=True, editable=False,
+                                     verbose_name='Миниатюры аватара')
     git = models.URLField(max_length=100, null=False, blank=False, verbose_name='Ссылка')
     self = models.TextField(max_length=300, null=False, blank=False, default="None", verbose_name='О себе')
 
@@ -0,0 +1,11 @@
+from django import template
+
+from accounts.avatars import get_avatar_url
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar_url(profile, size=250):
+    return get_avatar_url(profile, int(size))
@@ -1,3 +1,168 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from accounts.models import AuthToken, OutboxEmail, OUTBOX_STATUS_FAILED, OUTBOX_STATUS_PENDING, \
+    OUTBOX_STATUS_SENT, TOKEN_TYPE_PASSWORD_RESET, TOKEN_TYPE_REGISTER
+from accounts.management.commands.send_outbox import Command as SendOutboxCommand
+from accounts.tokens import SignedToken, create_token, get_token
+
+
+LEASE = timedelta(minutes=5)
+
+
+class OutboxClaimTest(TestCase):
+    def setUp(self):
+        self.first = OutboxEmail.enqueue('first@example.com', 'Тема', 'Текст')
+        self.second = OutboxEmail.enqueue('second@example.com', 'Тема', 'Текст')
+
+    def test_claim_skips_delayed_and_finished_emails(self):
+        OutboxEmail.objects.filter(pk=self.second.pk).update(available_at=now() + timedelta(hours=1))
+        sent = OutboxEmail.enqueue('sent@example.com', 'Тема', 'Текст')
+        sent.mark_sent()
+        self.assertEqual(OutboxEmail.claim('a', 10, LEASE), [self.first])
+
+    def test_claim_respects_batch_size(self):
+        self.assertEqual(OutboxEmail.claim('a', 1, LEASE), [self.first])
+        self.assertEqual(OutboxEmail.claim('b', 1, LEASE), [self.second])
+
+    def test_leased_emails_are_not_claimed_twice(self):
+        claimed = OutboxEmail.claim('a', 10, LEASE)
+        self.assertEqual({email.locked_by for email in claimed}, {'a'})
+        self.assertEqual(OutboxEmail.claim('b', 10, LEASE), [])
+
+    def test_expired_lease_can_be_taken_over(self):
+        OutboxEmail.claim('a', 10, LEASE)
+        # обработчик 'a' упал, не отправив письма
+        OutboxEmail.objects.update(locked_until=now() - timedelta(seconds=1))
+        self.assertEqual(OutboxEmail.claim('b', 10, LEASE), [self.first, self.second])
+
+    def test_interleaved_claim_does_not_take_sent_email(self):
+        # 'a' выбрал письма, но до его UPDATE 'b' успел их взять, отправить и снять блокировку
+        update = QuerySet.update
+        interleaved = []
+
+        def update_after_other_worker(queryset, **kwargs):
+            if not interleaved:
+                interleaved.append(True)
+                for email in OutboxEmail.claim('b', 10, LEASE):
+                    email.mark_sent()
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_after_other_worker):
+            self.assertEqual(OutboxEmail.claim('a', 10, LEASE), [])
+        self.assertEqual(set(OutboxEmail.objects.values_list('status', 'locked_by')), {(OUTBOX_STATUS_SENT, None)})
+
+    def test_send_batch_skips_finished_emails(self):
+        self.first.mark_sent()
+        options = {'max_attempts': 5, 'backoff': 60}
+        self.assertEqual(SendOutboxCommand().send_batch([self.first, self.second], options), (1, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['second@example.com']])
+
+
+class OutboxStatusTest(TestCase):
+    def setUp(self):
+        self.email = OutboxEmail.enqueue('user@example.com', 'Тема', 'Текст')
+        OutboxEmail.claim('a', 10, LEASE)
+        self.email.refresh_from_db()
+
+    def test_mark_sent_releases_lease(self):
+        self.email.mark_sent()
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OUTBOX_STATUS_SENT)
+        self.assertEqual(self.email.attempts, 1)
+        self.assertIsNone(self.email.locked_by)
+        self.assertEqual(OutboxEmail.claim('b', 10, LEASE), [])
+
+    def test_mark_failed_backs_off_exponentially(self):
+        started = now()
+        self.email.mark_failed('timeout', max_attempts=5, backoff=60)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OUTBOX_STATUS_PENDING)
+        self.assertEqual(self.email.last_error, 'timeout')
+        self.assertIsNone(self.email.locked_until)
+        self.assertGreaterEqual(self.email.available_at, started + timedelta(seconds=60))
+        self.assertEqual(OutboxEmail.claim('b', 10, LEASE), [])
+        self.email.mark_failed('timeout', max_attempts=5, backoff=60)
+        self.assertGreaterEqual(self.email.available_at, started + timedelta(seconds=120))
+
+    def test_mark_failed_gives_up_after_max_attempts(self):
+        self.email.mark_failed('timeout', max_attempts=2, backoff=60)
+        self.email.mark_failed('timeout', max_attempts=2, backoff=60)
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), (OUTBOX_STATUS_FAILED, 2))
+
+
+class SendOutboxCommandTest(TestCase):
+    def test_sends_pending_emails(self):
+        OutboxEmail.enqueue('user@example.com', 'Тема', 'Текст', html_message='<p>Текст</p>')
+        out = StringIO()
+        call_command('send_outbox', stdout=out)
+        self.assertIn('Отправлено: 1', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertEqual(OutboxEmail.objects.get().status, OUTBOX_STATUS_SENT)
+
+
+class TokenTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user', 'user@example.com', 'secret', is_active=False)
+
+    def test_signed_token_round_trip(self):
+        token = create_token(self.user, type=TOKEN_TYPE_PASSWORD_RESET)
+        self.assertIsInstance(token, SignedToken)
+        loaded = get_token(token.token, type=TOKEN_TYPE_PASSWORD_RESET)
+        self.assertEqual(loaded.user, self.user)
+        self.assertTrue(loaded.is_alive())
+        self.assertIsNone(get_token(token.token, type=TOKEN_TYPE_REGISTER))
+
+    def test_tampered_token_is_rejected(self):
+        token = create_token(self.user).token
+        self.assertIsNone(get_token(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        self.assertIsNone(get_token('garbage'))
+
+    def test_signed_token_expires(self):
+        with mock.patch('accounts.tokens.time.time', return_value=time.time() - 8 * 24 * 60 * 60):
+            token = create_token(self.user, life_days=7)
+        self.assertFalse(get_token(token.token).is_alive())
+
+    def test_signed_token_invalidated_by_user_change(self):
+        reset = create_token(self.user, type=TOKEN_TYPE_PASSWORD_RESET).token
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertIsNone(get_token(reset))
+        register = create_token(self.user).token
+        self.user.is_active = True
+        self.user.save()
+        self.assertIsNone(get_token(register))
+
+    def test_activation_link_works_once(self):
+        url = reverse('accounts:activate', kwargs={'token': create_token(self.user).token})
+        self.client.get(url)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.client.logout()
+        self.client.get(url)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_database_tokens_still_resolve(self):
+        # ссылки из писем, отправленных до включения подписанных токенов
+        token = AuthToken.objects.create(user=self.user, life_days=7)
+        self.assertEqual(get_token(str(token.token)), token)
+        AuthToken.objects.filter(pk=token.pk).update(created_at=now() - timedelta(days=8))
+        self.assertFalse(get_token(str(token.token)).is_alive())
+
+    @override_settings(AUTH_TOKENS_SIGNED=False)
+    def test_database_tokens_when_signing_disabled(self):
+        token = create_token(self.user)
+        self.assertIsInstance(token, AuthToken)
+        self.assertEqual(get_token(token.token, type=TOKEN_TYPE_REGISTER), token)
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.timezone import now, utc
+
+from .models import AuthToken, TOKEN_TYPE_REGISTER
+
+
+class SignedToken:
+    """
+    Токен без строки в базе: id пользователя, тип, срок жизни и время выдачи
+    подписаны SECRET_KEY. В токен входит отпечаток пароля, last_login и is_active,
+    поэтому после активации или смены пароля он перестаёт подходить сам собой.
+    """
+    salt = 'accounts.tokens.SignedToken'
+
+    def __init__(self, user, type, life_days, created_at, token=None):
+        self.user = user
+        self.type = type
+        self.life_days = life_days
+        self.created_at = created_at
+        self.token = token
+
+    @classmethod
+    def get_state(cls, user):
+        value = f'{user.pk}{user.password}{user.last_login}{user.is_active}'
+        return salted_hmac(cls.salt, value).hexdigest()[:20]
+
+    @classmethod
+    def create(cls, user, life_days=7, type=TOKEN_TYPE_REGISTER):
+        created = int(time.time())
+        token = signing.dumps([user.pk, type, life_days, created, cls.get_state(user)], salt=cls.salt)
+        return cls(user, type, life_days, datetime.fromtimestamp(created, utc), token)
+
+    @classmethod
+    def get_token(cls, token):
+        try:
+            pk, type, life_days, created, state = signing.loads(token, salt=cls.salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        user = get_user_model().objects.filter(pk=pk).first()
+        if user is None or not constant_time_compare(state, cls.get_state(user)):
+            return None
+        return cls(user, type, life_days, datetime.fromtimestamp(created, utc), token)
+
+    def is_alive(self):
+        return (self.created_at + timedelta(days=self.life_days)) >= now()
+
+    def delete(self):
+        # отзывать нечего: токен становится недействительным при изменении пользователя
+        pass
+
+
+def create_token(user, life_days=7, type=TOKEN_TYPE_REGISTER):
+    if settings.AUTH_TOKENS_SIGNED:
+        return SignedToken.create(user, life_days=life_days, type=type)
+    return AuthToken.objects.create(user=user, life_days=life_days, type=type)
+
+
+def get_token(token, type=None):
+    # UUID — токен из таблицы AuthToken; такие ссылки из уже отправленных
+    # писем продолжают работать и после включения подписанных токенов
+    try:
+        result = AuthToken.get_token(UUID(str(token)))
+    except ValueError:
+        result = SignedToken.get_token(str(token))
+    if result is not None and type is not None and result.type != type:
+        return None
+    return result
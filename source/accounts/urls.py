@@ -8,10 +8,10 @@ urlpatterns = [
     path('login/', LoginViewSession.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('register/', RegisterView.as_view(), name='create'),
-    path('activate/<uuid:token>/', RegisterActivateView.as_view(), name='activate'),
+    path('activate/<str:token>/', RegisterActivateView.as_view(), name='activate'),
     path('<int:pk>/', UserDetailView.as_view(), name='detail'),
     path('<int:pk>/update/', UserChangeView.as_view(), name='change'),
     path('password-change/', UserPasswordChangeView.as_view(), name='password_change'),
     path('password-reset/', UserPasswordResetEmailView.as_view(), name='password_reset_email'),
-    path('password-reset/<uuid:token>/', UserPasswordResetView.as_view(), name='password_reset')
+    path('password-reset/<str:token>/', UserPasswordResetView.as_view(), name='password_reset')
 ]
@@ -10,7 +10,9 @@ from django.conf import settings
 
 from accounts.forms import MyUserCreationForm, UserChangeForm, ProfileChangeForm, \
     PasswordChangeForm, PasswordResetEmailForm, PasswordResetForm
-from .models import AuthToken, Profile
+from .avatars import schedule_thumbnails
+from .models import Profile, TOKEN_TYPE_REGISTER, TOKEN_TYPE_PASSWORD_RESET
+from .tokens import get_token
 
 
 class RegisterView(CreateView):
@@ -37,7 +39,7 @@ class RegisterView(CreateView):
 
 class RegisterActivateView(View):
     def get(self, request, *args, **kwargs):
-        token = AuthToken.get_token(self.kwargs.get('token'))
+        token = get_token(self.kwargs.get('token'), type=TOKEN_TYPE_REGISTER)
         if token:
             if token.is_alive():
                 self.activate_user(token)
@@ -88,7 +90,14 @@ class UserChangeView(UserPassesTestMixin, UpdateView):
 
     def form_valid(self, form, profile_form):
         form.save()
-        profile_form.save()
+        profile = profile_form.save(commit=False)
+        avatar_changed = 'avatar' in profile_form.changed_data
+        if avatar_changed:
+            profile.avatar_thumbs = None
+        profile.save()
+        if avatar_changed:
+            # миниатюры считаются в пуле процессов, ответ не ждёт Pillow
+            schedule_thumbnails(profile)
         return HttpResponseRedirect(self.get_success_url())
 
     def form_invalid(self, form, profile_form):
@@ -152,7 +161,9 @@ class UserPasswordResetView(UpdateView):
         return super().form_valid(form)
 
     def get_token(self):
-        return AuthToken.get_token(self.kwargs.get('token'))
+        if not hasattr(self, '_token'):
+            self._token = get_token(self.kwargs.get('token'), type=TOKEN_TYPE_PASSWORD_RESET)
+        return self._token
 
 
 class LoginViewSession(LoginView):
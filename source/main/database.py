@@ -0,0 +1,95 @@
+import os
+
+
+REPLICA_ALIAS = 'replica'
+
+# кэш в памяти процесса: изменение, сделанное в одном процессе, не увидят остальные
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Применяются к каждому новому соединению SQLite (webapp.db.configure_sqlite).
+# busy_timeout ждёт блокировку вместо ошибки "database is locked"; остальные
+# настройки действуют только на время соединения и файл базы не меняют.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+# journal_mode=WAL записывается в заголовок файла базы навсегда, поэтому
+# включается только явно: DB_SQLITE_WAL=1. WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+}
+
+
+def env(name, default=None, environ=os.environ):
+    value = environ.get(name)
+    return default if value in (None, '') else value
+
+
+def database_config(prefix, base_dir, environ=os.environ, default_name='db.sqlite3'):
+    engine = env(f'{prefix}_ENGINE', 'django.db.backends.sqlite3', environ)
+    name = env(f'{prefix}_NAME', default_name, environ)
+    if engine.endswith('sqlite3') and not os.path.isabs(name):
+        name = os.path.join(base_dir, name)
+    config = {
+        'ENGINE': engine,
+        'NAME': name,
+        'CONN_MAX_AGE': int(env(f'{prefix}_CONN_MAX_AGE', 60, environ)),
+    }
+    for key in ('USER', 'PASSWORD', 'HOST', 'PORT'):
+        value = env(f'{prefix}_{key}', None, environ)
+        if value is not None:
+            config[key] = value
+    return config
+
+
+def sqlite_pragmas(environ=os.environ):
+    pragmas = dict(SQLITE_PRAGMAS)
+    if env('DB_SQLITE_WAL', '0', environ) == '1':
+        pragmas.update(SQLITE_WAL_PRAGMAS)
+    return pragmas
+
+
+def get_databases(base_dir, environ=os.environ):
+    """
+    DATABASES из переменных окружения: DB_ENGINE, DB_NAME, DB_USER, DB_PASSWORD,
+    DB_HOST, DB_PORT, DB_CONN_MAX_AGE. Если задан DB_REPLICA_NAME или DB_REPLICA_HOST,
+    добавляется алиас replica с теми же настройками поверх DB_REPLICA_*; для
+    локальной проверки это может быть второй файл SQLite (см. sync_replica).
+    """
+    databases = {'default': database_config('DB', base_dir, environ)}
+    if env('DB_REPLICA_NAME', None, environ) or env('DB_REPLICA_HOST', None, environ):
+        replica_environ = dict(environ)
+        for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT', 'CONN_MAX_AGE'):
+            if env(f'DB_REPLICA_{key}', None, environ) is None and env(f'DB_{key}', None, environ) is not None:
+                replica_environ[f'DB_REPLICA_{key}'] = environ[f'DB_{key}']
+        replica = database_config('DB_REPLICA', base_dir, replica_environ)
+        # в тестах реплика — та же база, иначе записи не видны при чтении
+        replica['TEST'] = {'MIRROR': 'default'}
+        databases[REPLICA_ALIAS] = replica
+    return databases
+
+
+def get_caches(environ=os.environ):
+    """
+    CACHES из переменных окружения: CACHE_BACKEND, CACHE_LOCATION, CACHE_KEY_PREFIX.
+    Без них — LocMemCache, своя у каждого процесса: с ней кэш страниц
+    и кэширующий движок сессий не включаются.
+    """
+    config = {'BACKEND': env('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache', environ)}
+    for key in ('LOCATION', 'KEY_PREFIX'):
+        value = env(f'CACHE_{key}', None, environ)
+        if value is not None:
+            config[key] = value
+    return {'default': config}
+
+
+def is_shared_cache_config(config):
+    return config['BACKEND'] not in PROCESS_LOCAL_CACHES
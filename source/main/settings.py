@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from main.database import get_caches, get_databases, is_shared_cache_config, sqlite_pragmas
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -24,7 +26,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = '6=kcd=#f*ay(x%(*%dhh#@qtpakcjq(5+u*5@z+9uujas&ja@h'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = []
 
@@ -44,29 +46,39 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'webapp.perf.PerformanceMiddleware',
+    'webapp.db.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'webapp.middleware.CartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'main.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # без DEBUG шаблоны компилируются один раз на процесс
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'webapp.context_processors.search_form',
+                'webapp.context_processors.cart',
             ],
         },
     },
@@ -78,12 +90,44 @@ WSGI_APPLICATION = 'main.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
-}
+# Настройки базы берутся из окружения (DB_*, DB_REPLICA_*), см. main/database.py
+DATABASES = get_databases(BASE_DIR)
+
+# PRAGMA для каждого соединения SQLite; режим WAL — только при DB_SQLITE_WAL=1
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+DATABASE_ROUTERS = ['webapp.db.ReplicaRouter']
+
+# Приложения, чьи модели представления каталога читают с реплики
+REPLICA_READ_APPS = ['webapp']
+
+# После изменяющего запроса посетитель столько секунд читает только из default
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# Версия каталога для кэша страниц хранится здесь же, поэтому при нескольких
+# процессах нужен общий бэкенд (memcached, redis): CACHE_BACKEND, CACHE_LOCATION.
+# С локальной памятью кэш страниц анонимных посетителей не используется.
+
+CACHES = get_caches()
+
+
+# Cart
+# webapp.cart.DatabaseCart — строки Cart в базе, привязанные к сессии;
+# webapp.cart.SignedCookieCart и webapp.cart.CacheCart не пишут в базу до оформления заказа.
+
+CART_BACKEND = 'webapp.cart.DatabaseCart'
+CART_COOKIE_NAME = 'cart'
+CART_COOKIE_AGE = 60 * 60 * 24 * 14
+
+# Замеры времени запросов: заголовок Server-Timing и гистограммы по именам URL
+# за последние PERF_WINDOWS окон по PERF_WINDOW секунд (страница webapp:perf_stats)
+PERF_ENABLED = True
+PERF_SERVER_TIMING = True
+PERF_WINDOW = 60
+PERF_WINDOWS = 15
+PERF_FLUSH_INTERVAL = 10
 
 
 # Password validation
@@ -149,11 +193,39 @@ BASE_HOST = 'http://localhost:8000'
 
 ACTIVATE_USERS_EMAIL = False  # True
 
+# Подписанные токены активации и сброса пароля не пишутся в базу;
+# False — старый режим со строками AuthToken
+AUTH_TOKENS_SIGNED = True
+
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'uploads')
 MEDIA_URL = '/media/'
 
+# Префикс internal-location в nginx: если задан, файлы из MEDIA_ROOT отдаёт nginx
+# по заголовку X-Accel-Redirect, а приложение только проверяет запрос.
+MEDIA_ACCEL_REDIRECT = None
+
+
+# Сессии читаются из кэша, в django_session пишутся только изменения. Кэш должен
+# быть общим для процессов, поэтому с LocMemCache остаётся обычный движок в базе
+if is_shared_cache_config(CACHES['default']):
+    SESSION_ENGINE = 'webapp.session_backend'
+
+SESSION_SERIALIZER = 'webapp.session_backend.CompactJSONSerializer'
+
+# Как часто (в секундах) сохранять время активности и продлевать сессию
+SESSION_ACTIVITY_INTERVAL = 60 * 5
+
+# Время жизни кэша карточек товара в списке; ключ включает updated_at товара
+PRODUCT_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
 
-# SESSION_ENGINE = 'webapp.session_backend'
+# Кэш товаров по pk (webapp.product_cache): LRU в памяти процесса поверх
+# CACHES['default']. Актуальность проверяется по меткам в общем кэше, TTL
+# только ограничивает память. С кэшем процесса товары читаются из базы
+PRODUCT_CACHE_TIMEOUT = 60 * 5
+PRODUCT_CACHE_LOCAL_SIZE = 1000
+PRODUCT_CACHE_LOCAL_TTL = 30
 
-# SESSION_SERIALIZER = 'django.contrib.sessions.serializers.PickleSerializer'
+# Товары с остатком в слотах (StockShard, команда rebalance_stock): как часто
+# (в секундах) пересчитывать Product.amount после заказов
+STOCK_SYNC_INTERVAL = 5
@@ -1,18 +1,43 @@
 from django.contrib import admin
-from .models import Product, Cart, Order, OrderProduct
+from django.core.exceptions import PermissionDenied
+from django.urls import path
+
+from .exports import orders_csv_response
+from .models import Product, Cart, Order, OrderProduct, DailyProductSales, DailyCategorySales, StockShard
+
+
+class StockShardInline(admin.TabularInline):
+    # слоты меняет только rebalance_stock, здесь они для просмотра
+    model = StockShard
+    fields = ('slot', 'amount')
+    readonly_fields = ('slot', 'amount')
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 class ProductAdmin(admin.ModelAdmin):
     list_filter = ('category',)
-    list_display = ('pk', 'name', 'amount', 'price')
+    list_display = ('pk', 'name', 'amount', 'price', 'stock_shards')
     list_display_links = ('pk', 'name')
     search_fields = ('name',)
+    inlines = (StockShardInline,)
+
+    def get_readonly_fields(self, request, obj=None):
+        # у товара со слотами amount — производная сумма, правится через rebalance_stock
+        if obj is not None and obj.stock_shards:
+            return ('amount', 'stock_shards')
+        return ('stock_shards',)
 
 
 # Бонус
 class OrderProductAdmin(admin.TabularInline):
     model = OrderProduct
-    fields = ('product', 'qty')
+    fields = ('product', 'qty', 'price')
     extra = 0
 
 
@@ -22,8 +47,52 @@ class OrderAdmin(admin.ModelAdmin):
     list_display_links = ('pk', 'name')
     ordering = ('-created_at',)
     inlines = (OrderProductAdmin,)
+    actions = ('export_csv',)
+
+    def export_csv(self, request, queryset):
+        return orders_csv_response(queryset)
+    export_csv.short_description = 'Выгрузить в CSV'
+
+    def get_urls(self):
+        urls = [
+            path('export/', self.admin_site.admin_view(self.export_view), name='webapp_order_export'),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        # те же фильтры и поиск, что в списке: /admin/webapp/order/export/?<параметры списка>
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        changelist = self.get_changelist_instance(request)
+        return orders_csv_response(changelist.get_queryset(request))
+
+
+class SalesRollupAdmin(admin.ModelAdmin):
+    # отчёт по готовым суммам за день; строки пишет только оформление заказа и rebuild_sales
+    list_display = ('day', 'qty', 'revenue')
+    date_hierarchy = 'day'
+    ordering = ('-day',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class DailyProductSalesAdmin(SalesRollupAdmin):
+    list_display = ('day', 'product', 'qty', 'revenue')
+    list_select_related = ('product',)
+    list_filter = ('product__category',)
+
+
+class DailyCategorySalesAdmin(SalesRollupAdmin):
+    list_display = ('day', 'category', 'qty', 'revenue')
+    list_filter = ('category',)
 
 
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Cart)
 admin.site.register(Order, OrderAdmin)
+admin.site.register(DailyProductSales, DailyProductSalesAdmin)
+admin.site.register(DailyCategorySales, DailyCategorySalesAdmin)
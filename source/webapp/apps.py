@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WebappConfig(AppConfig):
     name = 'webapp'
+
+    def ready(self):
+        from webapp import db, session_backend, signals  # noqa: F401
@@ -0,0 +1,141 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils.timezone import now
+
+from accounts.models import Profile
+from webapp.models import (CATEGORY_CHOICES, Cart, DailyCategorySales, DailyProductSales, Order, OrderProduct,
+                           Product)
+
+
+BENCH_USER_PREFIX = 'bench_user_'
+BENCH_PASSWORD = 'benchmark'
+SEARCH_WORDS = ('чай', 'кофе', 'мыло', 'кукла', 'чайник', 'лампа', 'хлеб', 'мяч', 'утюг', 'сок',
+                'tea', 'coffee', 'soap', 'doll', 'kettle', 'lamp', 'bread', 'ball', 'iron', 'juice')
+ADJECTIVES = ('большой', 'малый', 'красный', 'синий', 'новый', 'classic', 'premium', 'eco', 'mini', 'max')
+
+
+def chunked(count, batch_size):
+    done = 0
+    while done < count:
+        size = min(batch_size, count - done)
+        yield done, size
+        done += size
+
+
+class DataGenerator:
+    """
+    Синтетические данные для нагрузочных замеров: товары, пользователи с профилями,
+    корзины и заказы. Строки пишутся пачками bulk_create в отдельных транзакциях,
+    в памяти держится только текущая пачка, поэтому масштаб — от тысяч до миллиона строк.
+    Все пользователи получают пароль BENCH_PASSWORD (хэш считается один раз).
+    """
+
+    def __init__(self, batch_size=1000, seed=None, log=None):
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.categories = [value for value, label in CATEGORY_CHOICES]
+
+    def product_name(self):
+        return f'{self.random.choice(ADJECTIVES)} {self.random.choice(SEARCH_WORDS)} {self.random.randint(1, 9999)}'
+
+    def create_products(self, count):
+        for start, size in chunked(count, self.batch_size):
+            products = [
+                Product(
+                    sku=f'BENCH-{uuid4().hex[:12]}',
+                    name=self.product_name(),
+                    description=' '.join(self.random.choices(SEARCH_WORDS + ADJECTIVES, k=12)),
+                    category=self.random.choice(self.categories),
+                    amount=self.random.choice((0, 5, 20, 100, 1000)),
+                    price=Decimal(self.random.randint(100, 500000)) / 100,
+                )
+                for i in range(size)
+            ]
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+            self.log(f'товары: {start + size}/{count}')
+
+    def create_users(self, count):
+        User = get_user_model()
+        password = make_password(BENCH_PASSWORD)
+        offset = User.objects.filter(username__startswith=BENCH_USER_PREFIX).count()
+        for start, size in chunked(count, self.batch_size):
+            numbers = range(offset + start, offset + start + size)
+            users = [User(username=f'{BENCH_USER_PREFIX}{n}', email=f'{BENCH_USER_PREFIX}{n}@example.com',
+                          password=password, is_active=True) for n in numbers]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                # bulk_create на SQLite не возвращает pk, поэтому перечитываем по именам
+                user_ids = User.objects.filter(username__in=[u.username for u in users]).values_list('pk', flat=True)
+                Profile.objects.bulk_create([Profile(user_id=pk, git='https://example.com') for pk in user_ids])
+            self.log(f'пользователи: {start + size}/{count}')
+
+    def sample_products(self, size=20000):
+        # без загрузки всего каталога: случайные pk из диапазона, цены одним запросом
+        bounds = Product.objects.filter(amount__gt=0).order_by('pk').values_list('pk', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            return []
+        pks = {self.random.randint(first, last) for i in range(size)}
+        return list(Product.objects.filter(pk__in=pks, amount__gt=0).values_list('pk', 'price'))
+
+    def sample_users(self, size=20000):
+        return list(get_user_model().objects.filter(username__startswith=BENCH_USER_PREFIX)
+                    .values_list('pk', flat=True)[:size])
+
+    def sample_lines(self, products, max_lines):
+        return self.random.sample(products, min(len(products), self.random.randint(1, max_lines)))
+
+    def create_orders(self, count, max_lines=4, days=365):
+        products = self.sample_products()
+        if not products:
+            self.log('нет товаров в наличии, заказы не созданы')
+            return
+        users = self.sample_users() or [None]
+        for start, size in chunked(count, self.batch_size):
+            last_pk = Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            orders = [Order(name=f'Покупатель {start + i}', phone='+996555000000', address='Бишкек',
+                            user_id=self.random.choice(users)) for i in range(size)]
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                # created_at заполняется auto_now_add, раскладываем пачку на случайный день в прошлом
+                created_at = now() - timedelta(days=self.random.randint(0, days),
+                                               seconds=self.random.randint(0, 86399))
+                order_ids = list(Order.objects.filter(pk__gt=last_pk).values_list('pk', flat=True))
+                Order.objects.filter(pk__gt=last_pk).update(created_at=created_at)
+                lines = []
+                for order_id in order_ids:
+                    for product_id, price in self.sample_lines(products, max_lines):
+                        lines.append(OrderProduct(order_id=order_id, product_id=product_id, price=price,
+                                                  qty=self.random.randint(1, 3)))
+                OrderProduct.objects.bulk_create(lines)
+            self.log(f'заказы: {start + size}/{count}')
+
+    def create_carts(self, count, max_lines=3):
+        products = self.sample_products()
+        if not products:
+            return
+        expire_date = now() + timedelta(days=14)
+        for start, size in chunked(count, self.batch_size):
+            sessions = [Session(session_key=uuid4().hex, session_data='', expire_date=expire_date)
+                        for i in range(size)]
+            carts = [Cart(session_id=session.session_key, product_id=product_id, qty=self.random.randint(1, 3))
+                     for session in sessions
+                     for product_id, price in self.sample_lines(products, max_lines)]
+            with transaction.atomic():
+                Session.objects.bulk_create(sessions)
+                Cart.objects.bulk_create(carts)
+            self.log(f'корзины: {start + size}/{count}')
+
+    def rebuild_sales(self):
+        with transaction.atomic():
+            DailyProductSales.rebuild()
+            DailyCategorySales.rebuild()
@@ -0,0 +1,81 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.test import RequestFactory, override_settings
+
+from webapp.benchmarks.report import percentile
+from webapp.views import IndexView
+
+
+class RenderOnlyCart:
+    # корзина без хранилища: замеряется только рендер списка
+    summary = {'count': 0, 'total': 0}
+
+    def process_response(self, response):
+        return response
+
+
+def build_request(per_page, user):
+    request = RequestFactory().get('/', {'per_page': per_page}, HTTP_HOST='localhost')
+    request.user = user
+    request.session = SessionBase()
+    request._messages = FallbackStorage(request)
+    request.cart = RenderOnlyCart()
+    return request
+
+
+def render_listing(per_page, user):
+    # время выборки страницы и время рендера шаблона отдельно
+    request = build_request(per_page, user)
+    start = time.perf_counter()
+    response = IndexView.as_view()(request)
+    view_time = time.perf_counter() - start
+    start = time.perf_counter()
+    response.render()
+    return view_time * 1000, (time.perf_counter() - start) * 1000, response
+
+
+def get_fragment_keys(response):
+    # ключи карточек из product/index.html ({% cache ... product_box pk updated_at %})
+    return [make_template_fragment_key('product_box', [product.pk, product.updated_at.isoformat()])
+            for product in response.context_data['products']]
+
+
+def measure_render(page_sizes=(5, 20, 50, 100), iterations=50, fragment_cache=True, user=None):
+    """
+    Рендер первой страницы каталога для каждого размера страницы. Пользователь
+    по умолчанию — суперпользователь: страница не попадает в кэш страниц,
+    а в карточках выводятся ссылки по правам. Без fragment_cache карточки
+    рендерятся каждый раз (таймаут кэша 0) — это точка сравнения.
+    Кэш не очищается целиком (в нём сессии, корзины, версия каталога): перед
+    замером и после него удаляются только ключи карточек замеренных страниц.
+    """
+    user = user or get_user_model().objects.filter(is_superuser=True).first()
+    if user is None:
+        raise ValueError('Нужен суперпользователь: python manage.py createsuperuser')
+    timeout = None if fragment_cache else 0
+    results = {}
+    settings_override = {} if fragment_cache else {'PRODUCT_FRAGMENT_CACHE_TIMEOUT': timeout}
+    with override_settings(**settings_override):
+        for per_page in page_sizes:
+            # прогрев: компиляция шаблонов и кэш карточек, собранных заново
+            view_ms, render_ms, response = render_listing(per_page, user)
+            fragment_keys = get_fragment_keys(response)
+            cache.delete_many(fragment_keys)
+            render_listing(per_page, user)
+            renders = []
+            for i in range(iterations):
+                view_ms, render_ms, response = render_listing(per_page, user)
+                renders.append(render_ms)
+            cache.delete_many(fragment_keys)
+            p50 = percentile(renders, 50)
+            results[per_page] = {
+                'render_p50_ms': round(p50, 2),
+                'render_p95_ms': round(percentile(renders, 95), 2),
+                'per_product_ms': round(p50 / per_page, 3),
+            }
+    return results
@@ -0,0 +1,77 @@
+import json
+import os
+import time
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def percentile(values, q):
+    # ближайший ранг по отсортированной выборке
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def run_scenario(scenario, iterations, warmup=0):
+    for i in range(warmup):
+        scenario.run_once()
+    timings, queries = [], []
+    start = time.perf_counter()
+    for i in range(iterations):
+        elapsed, count = scenario.run_once()
+        timings.append(elapsed)
+        queries.append(count)
+    wall = time.perf_counter() - start
+    return summarize(timings, queries, wall)
+
+
+def summarize(timings, queries, wall):
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'max_ms': round(max(timings), 2),
+        'rps': round(len(timings) / wall, 1) if wall else None,
+        'avg_queries': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH, headroom=1.5):
+    # пороги с запасом: время зависит от машины, число запросов — нет
+    baseline = load_baseline(path)
+    for name, result in results.items():
+        baseline[name] = {
+            'p95_ms': round(result['p95_ms'] * headroom, 1),
+            'p99_ms': round(result['p99_ms'] * headroom, 1),
+            'max_queries': result['max_queries'],
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def check_baseline(results, baseline, tolerance=0.0):
+    # возвращает список превышений порогов; tolerance — допуск по времени, доля
+    failures = []
+    for name, result in results.items():
+        limits = baseline.get(name)
+        if not limits:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if key in limits and result[key] > limits[key] * (1 + tolerance):
+                failures.append(f'{name}: {key} {result[key]} > {limits[key]}')
+        if 'max_queries' in limits and result['max_queries'] > limits['max_queries']:
+            failures.append(f'{name}: max_queries {result["max_queries"]} > {limits["max_queries"]}')
+    return failures
@@ -0,0 +1,155 @@
+import html
+import re
+import time
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from webapp.benchmarks.data import BENCH_PASSWORD, BENCH_USER_PREFIX, SEARCH_WORDS
+from webapp.models import Product
+
+
+NEXT_LINK_RE = re.compile(r'href="\?([^"]*)">Далее<')
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class Scenario:
+    """
+    Один сценарий — один замеряемый запрос за итерацию. Подготовка
+    (вход, товар в корзине) делается в prepare и в замер не попадает.
+    """
+    name = None
+    login = False
+
+    def __init__(self, rng):
+        self.random = rng
+        self.client = Client(HTTP_HOST='localhost')
+        self.product_ids = list(Product.objects.filter(amount__gt=100).values_list('pk', flat=True)[:1000]) \
+            or list(Product.objects.filter(amount__gt=0).values_list('pk', flat=True)[:1000])
+        if self.login:
+            self.username = self.get_username()
+            self.client.login(username=self.username, password=BENCH_PASSWORD)
+
+    def get_username(self):
+        username = get_user_model().objects.filter(username__startswith=BENCH_USER_PREFIX) \
+            .values_list('username', flat=True).first()
+        if username is None:
+            raise ValueError('Нет пользователей bench_user_*: сначала запустите generate_data')
+        return username
+
+    def prepare(self):
+        pass
+
+    def request(self):
+        raise NotImplementedError
+
+    def run_once(self):
+        self.prepare()
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            start = time.perf_counter()
+            response = self.request()
+            elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise ValueError(f'{self.name}: ответ {response.status_code}')
+        self.after(response)
+        return elapsed, counter.queries
+
+    def after(self, response):
+        pass
+
+
+class BrowseScenario(Scenario):
+    # листает каталог по курсорам, дойдя до конца — начинает сначала
+    name = 'browse'
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.query = ''
+
+    def request(self):
+        return self.client.get(reverse('webapp:index') + (f'?{self.query}' if self.query else ''))
+
+    def after(self, response):
+        match = NEXT_LINK_RE.search(response.content.decode())
+        self.query = html.unescape(match.group(1)) if match else ''
+
+
+class SearchScenario(Scenario):
+    name = 'search'
+
+    def request(self):
+        return self.client.get(reverse('webapp:index'), {'search': self.random.choice(SEARCH_WORDS)})
+
+
+class CartAddScenario(Scenario):
+    name = 'cart_add'
+
+    def request(self):
+        pk = self.random.choice(self.product_ids)
+        return self.client.post(reverse('webapp:product_add_to_cart', kwargs={'pk': pk}), {'qty': 1})
+
+    def after(self, response):
+        # чтобы корзина не росла бесконечно
+        if self.random.random() < 0.05:
+            self.client.cookies.clear()
+
+
+class CheckoutScenario(Scenario):
+    name = 'checkout'
+    login = True
+
+    def prepare(self):
+        for pk in self.random.sample(self.product_ids, min(3, len(self.product_ids))):
+            self.client.post(reverse('webapp:product_add_to_cart', kwargs={'pk': pk}), {'qty': 1})
+
+    def request(self):
+        return self.client.post(reverse('webapp:order_create'),
+                                {'name': 'Benchmark', 'phone': '+996555000000', 'address': 'Бишкек'})
+
+
+class OrderHistoryScenario(Scenario):
+    name = 'order_history'
+    login = True
+
+    def get_username(self):
+        # пользователь, у которого есть заказы
+        user = get_user_model().objects.filter(username__startswith=BENCH_USER_PREFIX, orders__isnull=False) \
+            .values_list('username', flat=True).order_by('-pk').first()
+        return user or super().get_username()
+
+    def request(self):
+        return self.client.get(reverse('webapp:watch_orders'))
+
+
+class LoginScenario(Scenario):
+    name = 'login'
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.username = self.get_username()
+
+    def prepare(self):
+        self.client.logout()
+
+    def request(self):
+        return self.client.post(reverse('accounts:login'),
+                                {'username': self.username, 'password': BENCH_PASSWORD})
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    BrowseScenario, SearchScenario, CartAddScenario, CheckoutScenario, OrderHistoryScenario, LoginScenario,
+)}
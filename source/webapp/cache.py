@@ -0,0 +1,91 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+from main.database import is_shared_cache_config
+
+
+CATALOG_VERSION_KEY = 'catalog-version'
+PAGE_CACHE_PREFIX = 'page-cache'
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+CART_BADGE_PLACEHOLDER = '__page_cache_cart_badge__'
+
+
+def is_cache_shared(alias=DEFAULT_CACHE_ALIAS):
+    return is_shared_cache_config(settings.CACHES[alias])
+
+
+def get_catalog_version():
+    # Версия каталога — время последнего изменения в миллисекундах, которое
+    # только растёт. После вытеснения ключа номер не должен начаться заново,
+    # иначе старые записи с тем же номером снова станут актуальными
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    now_ms = int(time.time() * 1000)
+    try:
+        version = cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, now_ms, None)
+        return get_catalog_version()
+    if version < now_ms:
+        # только incr: параллельные изменения не могут уменьшить версию
+        version = cache.incr(CATALOG_VERSION_KEY, now_ms - version)
+    return version
+
+
+def get_catalog_modified():
+    # время последнего изменения каталога (в том числе удаления товаров), секунды
+    return min(get_catalog_version() / 1000, time.time())
+
+
+def get_page_cache_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'{PAGE_CACHE_PREFIX}:{get_catalog_version()}:{path}'
+
+
+def get_cached_page(request, key):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    content, content_type = entry
+    return HttpResponse(fill_placeholders(request, content), content_type=content_type)
+
+
+def get_placeholder_context():
+    return {
+        'csrf_token': CSRF_PLACEHOLDER,
+        'cart_badge_placeholder': CART_BADGE_PLACEHOLDER,
+    }
+
+
+def fill_placeholders(request, content):
+    # всё, что зависит от посетителя, подставляется уже после кэша
+    content = content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+    if CART_BADGE_PLACEHOLDER.encode() in content:
+        badge = render_to_string('partial/cart_badge.html', {'cart_summary': request.cart.summary})
+        content = content.replace(CART_BADGE_PLACEHOLDER.encode(), badge.encode())
+    return content
+
+
+def set_cached_page(request, key, response, timeout):
+    # в кэш кладётся страница с заглушками вместо CSRF-токена и корзины,
+    # каждому посетителю подставляются его собственные значения.
+    # key считается до рендера: если каталог изменился во время рендера,
+    # запись окажется под старой версией и не будет отдана
+    content = response.content
+    if response.status_code == 200:
+        cache.set(key, (content, response['Content-Type']), timeout)
+    response.content = fill_placeholders(request, content)
+    return response
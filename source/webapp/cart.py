@@ -0,0 +1,407 @@
+import json
+from decimal import Decimal
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from webapp.models import Cart
+from webapp.product_cache import product_cache
+
+
+CART_SUMMARY_SESSION_KEY = 'cart_summary'
+
+
+def get_cart_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', 'webapp.cart.DatabaseCart'))
+
+
+class BaseCart:
+    """
+    Корзина текущего запроса. Строки корзины с товарами загружаются одним
+    запросом и не более одного раза за запрос; количество и сумма для шапки
+    сайта хранятся вместе с корзиной и пересчитываются только при её изменении.
+
+    Наследники задают только хранилище: load_lines, save_qty, remove_products,
+    set_quantities и чтение/запись сводки.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def load_lines(self):
+        raise NotImplementedError
+
+    def save_qty(self, product, qty, line=None):
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        raise NotImplementedError
+
+    def set_quantities(self, quantities, products):
+        raise NotImplementedError
+
+    def get_stored_summary(self):
+        raise NotImplementedError
+
+    def set_stored_summary(self, summary):
+        raise NotImplementedError
+
+    def process_response(self, response):
+        return response
+
+    @cached_property
+    def lines(self):
+        return self.load_lines()
+
+    def get_line(self, pk):
+        for line in self.lines:
+            if line.pk == pk:
+                return line
+        return None
+
+    def get_product_line(self, product_id):
+        for line in self.lines:
+            if line.product_id == product_id:
+                return line
+        return None
+
+    @property
+    def count(self):
+        return sum(line.qty for line in self.lines)
+
+    @property
+    def total(self):
+        return sum((line.total for line in self.lines), Decimal(0))
+
+    @property
+    def summary(self):
+        summary = self.get_stored_summary()
+        if summary is None:
+            summary = self.store_summary()
+        return {'count': summary['count'], 'total': Decimal(summary['total'])}
+
+    def store_summary(self):
+        summary = {'count': self.count, 'total': str(self.total)}
+        if self.get_stored_summary() != summary:
+            self.set_stored_summary(summary)
+        return summary
+
+    def as_json(self):
+        return {
+            'count': self.count,
+            'total': str(self.total),
+            'lines': [{'id': line.pk, 'product': line.product_id, 'name': line.product.name,
+                       'price': str(line.product.price), 'qty': line.qty, 'total': str(line.total)}
+                      for line in self.lines],
+        }
+
+    def refresh_summary(self):
+        if self.lines or self.get_stored_summary() is not None:
+            self.store_summary()
+
+    def changed(self):
+        self.__dict__.pop('lines', None)
+        self.store_summary()
+
+    def add(self, product, qty):
+        if qty < 1:
+            return False
+        line = self.get_product_line(product.pk)
+        if line is not None:
+            qty += line.qty
+        if qty > product.amount:
+            return False
+        self.save_qty(product, qty, line)
+        self.changed()
+        return True
+
+    def remove_one(self, line):
+        self.save_qty(line.product, line.qty - 1, line)
+        self.changed()
+
+    def remove(self, line):
+        self.save_qty(line.product, 0, line)
+        self.changed()
+
+    def plan(self, operations):
+        # Проверяет пакет операций add/set/remove одним запросом к товарам.
+        # Возвращает новые количества, загруженные товары и ошибки по операциям.
+        quantities = {line.product_id: line.qty for line in self.lines}
+        product_ids = set()
+        for operation in operations:
+            try:
+                product_ids.add(int(operation.get('product')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        products = product_cache.get_many(product_ids)
+        errors = []
+        for index, operation in enumerate(operations):
+            error = self.plan_operation(operation, quantities, products)
+            if error:
+                product = operation.get('product') if isinstance(operation, dict) else None
+                errors.append({'index': index, 'product': product, 'error': error})
+        return quantities, products, errors
+
+    def plan_operation(self, operation, quantities, products):
+        if not isinstance(operation, dict):
+            return 'Операция должна быть объектом'
+        op = operation.get('op')
+        if op not in ('add', 'set', 'remove'):
+            return 'Неизвестная операция'
+        try:
+            product = products.get(int(operation.get('product')))
+        except (TypeError, ValueError):
+            product = None
+        if product is None:
+            return 'Товар не найден'
+        if op == 'remove':
+            quantities[product.pk] = 0
+            return None
+        try:
+            qty = int(operation.get('qty', 1))
+        except (TypeError, ValueError):
+            return 'Неверное количество'
+        if qty < (1 if op == 'add' else 0):
+            return 'Неверное количество'
+        if op == 'add':
+            qty += quantities.get(product.pk, 0)
+        if qty > product.amount:
+            return f'Недостаточно товара, осталось {product.amount}'
+        quantities[product.pk] = qty
+        return None
+
+
+class DatabaseCart(BaseCart):
+    # строки Cart привязаны к строке Session, сводка хранится в самой сессии
+
+    @property
+    def session_key(self):
+        return self.request.session.session_key
+
+    def get_session_key(self, create=False):
+        # строка Session нужна только для записи в корзину, а не для чтения
+        if create and not self.session_key:
+            self.request.session.save()
+        return self.session_key
+
+    def load_lines(self):
+        if not self.session_key:
+            return []
+        # строки без JOIN, товары — из кэша товаров
+        lines = list(Cart.objects.filter(session_id=self.session_key).order_by('pk'))
+        products = product_cache.get_many(line.product_id for line in lines)
+        for line in lines:
+            if line.product_id in products:
+                line.product = products[line.product_id]
+                line.total = line.product.price * line.qty
+        return [line for line in lines if line.product_id in products]
+
+    def save_qty(self, product, qty, line=None):
+        if line is None:
+            if qty > 0:
+                Cart.objects.create(product=product, qty=qty, session_id=self.get_session_key(create=True))
+        elif qty < 1:
+            line.delete()
+        else:
+            line.qty = qty
+            line.save(update_fields=['qty'])
+
+    def remove_products(self, product_ids):
+        if self.session_key:
+            Cart.objects.filter(session_id=self.session_key, product_id__in=product_ids).delete()
+        self.changed()
+
+    def set_quantities(self, quantities, products):
+        lines = {line.product_id: line for line in self.lines}
+        created, updated, deleted = [], [], []
+        for product_id, qty in quantities.items():
+            line = lines.get(product_id)
+            if line is None:
+                if qty > 0:
+                    created.append(Cart(product=products[product_id], qty=qty,
+                                        session_id=self.get_session_key(create=True)))
+            elif qty < 1:
+                deleted.append(line.pk)
+            elif qty != line.qty:
+                line.qty = qty
+                updated.append(line)
+        Cart.objects.bulk_create(created)
+        Cart.objects.bulk_update(updated, ['qty'])
+        if deleted:
+            Cart.objects.filter(pk__in=deleted).delete()
+        self.changed()
+
+    def get_stored_summary(self):
+        if not self.session_key:
+            return {'count': 0, 'total': '0'}
+        stored = self.request.session.get(CART_SUMMARY_SESSION_KEY)
+        # сводка годится только для той сессии, в которой посчитана: при входе
+        # cycle_key переносит данные в новую сессию, а строки Cart старой удаляются
+        if not stored or stored.get('session') != self.session_key:
+            return None
+        return {'count': stored['count'], 'total': stored['total']}
+
+    def set_stored_summary(self, summary):
+        self.request.session[CART_SUMMARY_SESSION_KEY] = dict(summary, session=self.session_key)
+
+
+class CartLine:
+    # строка корзины, которой нет в базе: pk совпадает с pk товара
+
+    def __init__(self, product, qty):
+        self.product = product
+        self.qty = qty
+
+    @property
+    def pk(self):
+        return self.product.pk
+
+    @property
+    def product_id(self):
+        return self.product.pk
+
+    @property
+    def total(self):
+        return self.product.price * self.qty
+
+
+class ItemsCart(BaseCart):
+    # корзина вида {pk товара: количество} вне базы; строки Cart не создаются,
+    # заказ из неё сразу превращается в строки OrderProduct
+
+    def load_data(self):
+        raise NotImplementedError
+
+    def save_data(self, data):
+        raise NotImplementedError
+
+    @cached_property
+    def data(self):
+        data = self.load_data()
+        if not isinstance(data, dict) or not isinstance(data.get('items'), dict):
+            data = {'items': {}}
+        return data
+
+    @property
+    def items(self):
+        items = {}
+        for pk, qty in self.data['items'].items():
+            try:
+                items[int(pk)] = int(qty)
+            except (TypeError, ValueError):
+                continue
+        return items
+
+    def set_items(self, items):
+        self.data['items'] = {str(pk): qty for pk, qty in items.items() if qty > 0}
+        self.data.pop('summary', None)
+        self.save_data(self.data)
+
+    def load_lines(self):
+        items = self.items
+        if not items:
+            return []
+        products = product_cache.get_many(items.keys())
+        return [CartLine(products[pk], qty) for pk, qty in items.items() if pk in products]
+
+    def save_qty(self, product, qty, line=None):
+        items = self.items
+        items[product.pk] = qty
+        self.set_items(items)
+
+    def remove_products(self, product_ids):
+        items = self.items
+        for pk in product_ids:
+            items.pop(pk, None)
+        self.set_items(items)
+        self.changed()
+
+    def set_quantities(self, quantities, products):
+        self.set_items(quantities)
+        self.changed()
+
+    def get_stored_summary(self):
+        if not self.data['items']:
+            return {'count': 0, 'total': '0'}
+        return self.data.get('summary')
+
+    def set_stored_summary(self, summary):
+        self.data['summary'] = summary
+        self.save_data(self.data)
+
+
+class SignedCookieCart(ItemsCart):
+    cookie_salt = 'webapp.cart'
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+    @property
+    def cookie_age(self):
+        return getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 14)
+
+    def load_data(self):
+        self.dirty = False
+        value = self.request.get_signed_cookie(self.cookie_name, default=None, salt=self.cookie_salt,
+                                               max_age=self.cookie_age)
+        try:
+            return json.loads(value) if value else None
+        except ValueError:
+            return None
+
+    def save_data(self, data):
+        self.dirty = True
+
+    def process_response(self, response):
+        if not getattr(self, 'dirty', False):
+            return response
+        if self.data['items']:
+            value = json.dumps(self.data, separators=(',', ':'))
+            response.set_signed_cookie(self.cookie_name, value, salt=self.cookie_salt, max_age=self.cookie_age,
+                                       httponly=True, samesite='Lax')
+        else:
+            response.delete_cookie(self.cookie_name)
+        return response
+
+
+class CacheCart(ItemsCart):
+    # в cookie лежит только случайный идентификатор, сама корзина — в кэше
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+    @property
+    def cookie_age(self):
+        return getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 14)
+
+    @cached_property
+    def cart_id(self):
+        value = self.request.COOKIES.get(self.cookie_name, '')
+        if len(value) == 32 and value.isalnum():
+            return value
+        return None
+
+    def get_cache_key(self, cart_id):
+        return f'cart:{cart_id}'
+
+    def load_data(self):
+        self.new_cart_id = None
+        if self.cart_id is None:
+            return None
+        return cache.get(self.get_cache_key(self.cart_id))
+
+    def save_data(self, data):
+        if self.cart_id is None:
+            self.cart_id = self.new_cart_id = uuid4().hex
+        cache.set(self.get_cache_key(self.cart_id), data, self.cookie_age)
+
+    def process_response(self, response):
+        if getattr(self, 'new_cart_id', None):
+            response.set_cookie(self.cookie_name, self.new_cart_id, max_age=self.cookie_age,
+                                httponly=True, samesite='Lax')
+        return response
@@ -1,6 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
 from webapp.forms import SimpleSearchForm
 
 
 def search_form(request):
     form = SimpleSearchForm(request.GET)
     return {'search_form': form}
+
+
+def cart(request):
+    if not hasattr(request, 'cart'):
+        return {}
+    return {'cart_summary': SimpleLazyObject(lambda: request.cart.summary)}
@@ -0,0 +1,118 @@
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from main.database import REPLICA_ALIAS
+
+
+_use_replica = ContextVar('use_replica', default=False)
+
+REPLICA_PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def replica_enabled():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class use_replica:
+    # чтения внутри блока идут на реплику; вне запроса — например, в отчётах
+    def __enter__(self):
+        self.token = _use_replica.set(True)
+
+    def __exit__(self, *args):
+        _use_replica.reset(self.token)
+
+
+def read_from_primary():
+    # до конца запроса все чтения идут в default: то, что ляжет в общий кэш
+    # под текущей версией каталога, не должно быть прочитано с отставшей реплики.
+    # Прежнее значение восстановит ReplicaMiddleware в конце запроса
+    if _use_replica.get():
+        _use_replica.set(False)
+
+
+class ReplicaRouter:
+    """
+    Все записи — в default. Чтения моделей из REPLICA_READ_APPS уходят на реплику
+    только там, где их явно разрешил ReplicaMiddleware (представления
+    с use_replica = True) или блок use_replica(). Миграции применяются только к default: схему на реплику
+    переносит репликация.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or not replica_enabled():
+            return 'default'
+        # сессии и пользователи всегда читаются из default: если реплика отстала,
+        # SessionMiddleware сочтёт сессию пустой и удалит cookie, то есть разлогинит
+        if model._meta.app_label not in getattr(settings, 'REPLICA_READ_APPS', ('webapp',)):
+            return 'default'
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaMiddleware:
+    """
+    Безопасные запросы к представлениям с use_replica = True читают с реплики.
+    После любого изменяющего запроса посетитель на REPLICA_PIN_SECONDS
+    закрепляется за default (cookie), чтобы видеть свои же записи, пока
+    реплика догоняет: новый заказ в истории, новую сессию после входа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @property
+    def pin_seconds(self):
+        return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_replica_token', None)
+            if token is not None:
+                _use_replica.reset(token)
+        if request.method not in SAFE_METHODS and replica_enabled():
+            response.set_cookie(REPLICA_PIN_COOKIE, str(int(time.time()) + self.pin_seconds),
+                                max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def is_pinned(self, request):
+        try:
+            return int(request.COOKIES.get(REPLICA_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method not in SAFE_METHODS or not getattr(view_class, 'use_replica', False):
+            return None
+        if not replica_enabled() or self.is_pinned(request):
+            return None
+        # остаётся до конца запроса, включая рендер шаблона
+        request._replica_token = _use_replica.set(True)
+        return None
@@ -0,0 +1,55 @@
+import csv
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from webapp.models import OrderProduct
+
+
+ORDER_CSV_HEADER = ('order_id', 'created_at', 'name', 'phone', 'address', 'user_id',
+                    'product_id', 'product_name', 'qty', 'price')
+
+
+class Echo:
+    # csv.writer пишет в "файл", который просто возвращает строку
+    def write(self, value):
+        return value
+
+
+def iter_orders(queryset, chunk_size=500):
+    # iterator() не умеет prefetch_related, поэтому идём пачками по pk:
+    # на каждую пачку два запроса, в памяти не больше chunk_size заказов
+    lines = Prefetch('order_products', queryset=OrderProduct.objects.select_related('product').order_by('pk'))
+    queryset = queryset.order_by('pk').prefetch_related(lines)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        orders = list(chunk[:chunk_size])
+        if not orders:
+            return
+        yield from orders
+        last_pk = orders[-1].pk
+
+
+def iter_order_rows(queryset, chunk_size=500):
+    for order in iter_orders(queryset, chunk_size):
+        head = (order.pk, order.created_at.isoformat(), order.name, order.phone, order.address, order.user_id or '')
+        lines = order.order_products.all()
+        if not lines:
+            yield head + ('', '', '', '')
+        for line in lines:
+            yield head + (line.product_id, line.product.name, line.qty, line.price)
+
+
+def orders_csv_response(queryset, filename='orders.csv', chunk_size=500):
+    writer = csv.writer(Echo())
+    rows = iter_order_rows(queryset, chunk_size)
+    content = (writer.writerow(row) for row in _with_header(rows))
+    response = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _with_header(rows):
+    yield ORDER_CSV_HEADER
+    yield from rows
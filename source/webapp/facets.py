@@ -0,0 +1,73 @@
+from django.core.cache import cache
+from django.db import router
+from django.db.models import BooleanField, Case, Count, When
+
+from webapp.cache import get_catalog_version, is_cache_shared
+from webapp.models import CATEGORY_CHOICES
+
+
+FACET_CACHE_PREFIX = 'product-facets'
+FACET_CACHE_TIMEOUT = 60 * 60
+
+STOCK_ALL = ''
+STOCK_IN = 'in'
+STOCK_CHOICES = (
+    (STOCK_ALL, 'Все'),
+    (STOCK_IN, 'В наличии'),
+)
+
+
+def get_facet_rows(queryset):
+    # один GROUP BY по (категория, есть ли в наличии): из него считаются
+    # и счётчики категорий, и счётчики наличия при любом выбранном фильтре
+    in_stock = Case(When(amount__gt=0, then=True), default=False, output_field=BooleanField())
+    rows = queryset.order_by().annotate(in_stock=in_stock).values('category', 'in_stock') \
+        .annotate(count=Count('pk'))
+    return [(row['category'], bool(row['in_stock']), row['count']) for row in rows]
+
+
+def get_cached_facet_rows(queryset):
+    # счётчики без поиска одинаковы для всех посетителей; версия каталога
+    # меняется при любом изменении товаров, старые ключи просто истекают.
+    # Считаются по default: с отставшей реплики под новой версией легли бы старые остатки.
+    # Кэш в памяти процесса не узнает об изменениях в других процессах, с ним не кэшируем
+    if not is_cache_shared():
+        return get_facet_rows(queryset)
+    key = f'{FACET_CACHE_PREFIX}:{get_catalog_version()}'
+    primary = router.db_for_write(queryset.model)
+    return cache.get_or_set(key, lambda: get_facet_rows(queryset.using(primary)), FACET_CACHE_TIMEOUT)
+
+
+class ProductFacets:
+    def __init__(self, rows, category=None, stock=STOCK_ALL):
+        self.rows = rows
+        self.category = category or None
+        self.stock = stock or STOCK_ALL
+
+    def filter(self, queryset):
+        if self.category:
+            queryset = queryset.filter(category=self.category)
+        if self.stock == STOCK_IN:
+            queryset = queryset.filter(amount__gt=0)
+        return queryset
+
+    def count(self, category=None, stock=STOCK_ALL):
+        return sum(count for row_category, in_stock, count in self.rows
+                   if (category is None or row_category == category) and (stock == STOCK_ALL or in_stock))
+
+    @property
+    def categories(self):
+        facets = [{'value': '', 'label': 'Все категории', 'count': self.count(stock=self.stock),
+                   'selected': self.category is None}]
+        for value, label in CATEGORY_CHOICES:
+            count = self.count(value, self.stock)
+            if count or value == self.category:
+                facets.append({'value': value, 'label': label, 'count': count,
+                               'selected': value == self.category})
+        return facets
+
+    @property
+    def stock_choices(self):
+        return [{'value': value, 'label': label, 'count': self.count(self.category, value),
+                 'selected': value == self.stock}
+                for value, label in STOCK_CHOICES]
@@ -1,15 +1,59 @@
 from django import forms
-from webapp.models import Product, Cart, Order
+from webapp.models import Product, Cart, Order, StockShard, CATEGORY_CHOICES
+from webapp.facets import STOCK_CHOICES
 
 
 class SimpleSearchForm(forms.Form):
     search = forms.CharField(max_length=100, required=False, label="Найти")
 
 
+class ProductFacetForm(forms.Form):
+    category = forms.ChoiceField(choices=(('', 'Все категории'),) + CATEGORY_CHOICES, required=False,
+                                 label='Категория')
+    stock = forms.ChoiceField(choices=STOCK_CHOICES, required=False, label='Наличие')
+
+
 class ProductForm(forms.ModelForm):
+    # остаток не пишется в товар напрямую: у товара со слотами amount — сумма
+    # слотов, а пока форма была открыта, заказы могли его уменьшить. Форма
+    # отправляет и остаток, с которым её открыли (initial-amount), и к текущему
+    # остатку применяется только разница через StockShard.rebalance
+    amount = forms.IntegerField(min_value=0, label='Остаток', show_hidden_initial=True)
+
     class Meta:
         model = Product
-        exclude = []
+        exclude = ['amount', 'stock_shards']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['amount'].initial = self.instance.amount
+
+    def get_opened_amount(self):
+        # остаток на момент открытия формы; без скрытого поля — текущий
+        field = self.fields['amount']
+        value = field.hidden_widget().value_from_datadict(self.data, self.files, self.add_initial_prefix('amount'))
+        try:
+            opened = field.to_python(value)
+        except forms.ValidationError:
+            opened = None
+        return field.initial if opened is None else opened
+
+    def save(self, commit=True):
+        product = super().save(commit=False)
+        if not commit:
+            return product
+        if product.pk is None:
+            product.amount = self.cleaned_data['amount']
+            product.save()
+        else:
+            # updated_at (auto_now) пишется, только если указан в update_fields
+            product.save(update_fields=[name for name in self.fields if name != 'amount'] + ['updated_at'])
+            delta = self.cleaned_data['amount'] - self.get_opened_amount()
+            if delta:
+                StockShard.rebalance(product.pk, delta=delta)
+        self.save_m2m()
+        return product
 
 
 class CartAddForm(forms.ModelForm):
@@ -22,3 +66,8 @@ class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
         exclude = ['products', 'user']
+
+
+class OrderFilterForm(forms.Form):
+    date_from = forms.DateField(required=False, label='С', widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, label='По', widget=forms.DateInput(attrs={'type': 'date'}))
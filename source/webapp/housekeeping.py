@@ -0,0 +1,94 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils.timezone import now
+
+from accounts.models import AuthToken
+from webapp.models import Cart
+
+
+def pk_ranges(model, chunk_size):
+    # Границы (после, до] по chunk_size строк: граница берётся по индексу
+    # первичного ключа, поэтому каждый шаг читает не больше chunk_size ключей
+    pks = model.objects.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        page = pks if last is None else pks.filter(pk__gt=last)
+        bound = list(page[chunk_size - 1:chunk_size])
+        upper = bound[0] if bound else page.last()
+        if upper is None:
+            return
+        yield last, upper
+        if not bound:
+            return
+        last = upper
+
+
+def in_range(queryset, lower, upper):
+    queryset = queryset.filter(pk__lte=upper)
+    return queryset if lower is None else queryset.filter(pk__gt=lower)
+
+
+def expired_sessions():
+    return Session.objects.filter(expire_date__lt=now())
+
+
+def orphaned_carts():
+    # корзины без сессии; корзины истёкших сессий удаляются вместе с ними
+    session = Session.objects.filter(session_key=OuterRef('session_id'))
+    return Cart.objects.annotate(has_session=Exists(session)) \
+        .filter(Q(session__isnull=True) | Q(has_session=False))
+
+
+def expired_tokens():
+    # срок у каждого токена свой, но различных life_days единицы
+    current = now()
+    condition = Q(pk__in=[])
+    for days in AuthToken.objects.order_by().values_list('life_days', flat=True).distinct():
+        condition |= Q(life_days=days, created_at__lt=current - timedelta(days=days))
+    return AuthToken.objects.filter(condition)
+
+
+# задача: (модель, по ключам которой идём, функция со строками к удалению)
+TASKS = {
+    'sessions': (Session, expired_sessions),
+    'carts': (Cart, orphaned_carts),
+    'tokens': (AuthToken, expired_tokens),
+}
+
+
+def delete_in_chunks(model, get_queryset, chunk_size=1000, pause=0, log=None):
+    """
+    Удаляет строки get_queryset() по диапазонам первичного ключа модели. Каждый
+    диапазон — своя короткая транзакция, между ними можно сделать паузу, чтобы
+    блокировки записи не мешали живым запросам. Возвращает Counter по моделям
+    (Session удаляется вместе со своими Cart).
+    """
+    queryset = get_queryset()
+    deleted = Counter()
+    for lower, upper in pk_ranges(model, chunk_size):
+        with transaction.atomic():
+            pks = list(in_range(queryset, lower, upper).values_list('pk', flat=True))
+            if pks:
+                total, rows = model.objects.filter(pk__in=pks).delete()
+                deleted.update(rows)
+        if pks and log:
+            log(f'{model._meta.label}: до {upper}, удалено {len(pks)}')
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def run(tasks=None, chunk_size=1000, pause=0, log=None):
+    # Возвращает [(задача, Counter удалённых строк, секунд)]
+    results = []
+    for name in tasks or TASKS:
+        model, get_queryset = TASKS[name]
+        start = time.monotonic()
+        deleted = delete_in_chunks(model, get_queryset, chunk_size, pause, log)
+        results.append((name, deleted, time.monotonic() - start))
+    return results
@@ -0,0 +1,112 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings
+
+from webapp.benchmarks.report import BASELINE_PATH, check_baseline, load_baseline, run_scenario, save_baseline
+from webapp.benchmarks.scenarios import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет сценарии (каталог, поиск, корзина, заказ, история заказов, вход) '
+            'и сравнивает p95/p99 и число SQL-запросов с порогами baseline.json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Сценарии: {", ".join(SCENARIOS)} (по умолчанию все)')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', default=BASELINE_PATH)
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допуск к порогам времени, доля (пороги записаны на generate_data --scale 10000)')
+        parser.add_argument('--save-baseline', action='store_true', help='Записать пороги по этому прогону')
+        parser.add_argument('--keep', action='store_true',
+                            help='Писать корзины и заказы сценариев в саму базу, а не во временную копию')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+        rng = random.Random(options['seed'])
+        if options['keep']:
+            results = self.run_scenarios(names, rng, options)
+        else:
+            # каждый запрос идёт в своей транзакции, как в работе (с on_commit),
+            # но пишет в копию базы, а общий кэш видит под отдельным префиксом
+            with self.throwaway_database(), self.isolated_caches():
+                results = self.run_scenarios(names, rng, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+        else:
+            self.write_table(results)
+
+        if options['save_baseline']:
+            save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'Пороги записаны в {options["baseline"]}'))
+            return
+        failures = check_baseline(results, load_baseline(options['baseline']), options['tolerance'])
+        if failures:
+            raise CommandError('Превышены пороги:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Пороги не превышены'))
+
+    def run_scenarios(self, names, rng, options):
+        results = {}
+        for name in names:
+            try:
+                scenario = SCENARIOS[name](rng)
+                results[name] = run_scenario(scenario, options['iterations'], options['warmup'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        return results
+
+    @contextmanager
+    def throwaway_database(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Копию делаем только для SQLite: для другой базы запустите '
+                               'на отдельной тестовой базе с --keep')
+        original = connection.settings_dict['NAME']
+        fd, path = tempfile.mkstemp(prefix='benchmark-', suffix='.sqlite3')
+        os.close(fd)
+        source = sqlite3.connect(original)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        connection.close()
+        connection.settings_dict['NAME'] = path
+        try:
+            yield
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original
+            for name in (path, f'{path}-wal', f'{path}-shm'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def isolated_caches(self):
+        # данные копии (остатки после заказов) не должны попасть в кэш сайта
+        prefix = f'benchmark-{uuid4().hex[:8]}'
+        return override_settings(CACHES={alias: dict(config, KEY_PREFIX=prefix)
+                                         for alias, config in settings.CACHES.items()})
+
+    def write_table(self, results):
+        self.stdout.write(f'{"scenario":<15} {"req":>6} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8} '
+                          f'{"rps":>8} {"q avg":>6} {"q max":>6}')
+        for name, row in results.items():
+            self.stdout.write(f'{name:<15} {row["requests"]:>6} {row["p50_ms"]:>8} {row["p95_ms"]:>8} '
+                              f'{row["p99_ms"]:>8} {row["max_ms"]:>8} {row["rps"]:>8} '
+                              f'{row["avg_queries"]:>6} {row["max_queries"]:>6}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.benchmarks.render import measure_render
+
+
+class Command(BaseCommand):
+    help = 'Время рендера страницы каталога по размерам страницы, с кэшем карточек и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='5,20,50,100', help='Размеры страницы через запятую')
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: числа через запятую')
+        try:
+            cold = measure_render(sizes, options['iterations'], fragment_cache=False)
+            warm = measure_render(sizes, options['iterations'], fragment_cache=True)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'{"per_page":>8} {"без кэша p50":>14} {"с кэшем p50":>13} '
+                          f'{"мс/товар без":>13} {"мс/товар с":>11}')
+        for size in sizes:
+            self.stdout.write(f'{size:>8} {cold[size]["render_p50_ms"]:>14} {warm[size]["render_p50_ms"]:>13} '
+                              f'{cold[size]["per_product_ms"]:>13} {warm[size]["per_product_ms"]:>11}')
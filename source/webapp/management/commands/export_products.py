@@ -0,0 +1,43 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from webapp.models import Product
+
+
+# id нужен import_products для товаров без артикула
+FIELDS = ('id', 'sku', 'name', 'description', 'category', 'amount', 'price')
+
+
+class Command(BaseCommand):
+    help = 'Потоковый экспорт товаров в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Файл или "-" для stdout')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('jsonl' if options['path'].endswith('.jsonl') else 'csv')
+        stream = sys.stdout if options['path'] == '-' else open(options['path'], 'w', encoding='utf-8', newline='')
+        rows = Product.objects.order_by('pk').values_list(*FIELDS).iterator(chunk_size=options['chunk_size'])
+        count = 0
+        try:
+            if file_format == 'csv':
+                writer = csv.writer(stream)
+                writer.writerow(FIELDS)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    data = dict(zip(FIELDS, row))
+                    data['price'] = str(data['price'])
+                    stream.write(json.dumps(data, ensure_ascii=False) + '\n')
+                    count += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.stderr.write(f'Выгружено товаров: {count}')
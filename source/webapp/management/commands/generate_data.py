@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from webapp.benchmarks.data import DataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими товарами, пользователями, корзинами и заказами для замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000,
+                            help='Число товаров; остальное считается от него, если не задано явно')
+        parser.add_argument('--products', type=int, default=None)
+        parser.add_argument('--users', type=int, default=None)
+        parser.add_argument('--orders', type=int, default=None)
+        parser.add_argument('--carts', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        counts = {
+            'products': scale,
+            'users': max(1, scale // 10),
+            'orders': scale // 2,
+            'carts': scale // 20,
+        }
+        for name in counts:
+            if options[name] is not None:
+                counts[name] = options[name]
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        generator = DataGenerator(batch_size=options['batch_size'], seed=options['seed'], log=log)
+        generator.create_products(counts['products'])
+        generator.create_users(counts['users'])
+        generator.create_carts(counts['carts'])
+        generator.create_orders(counts['orders'])
+        generator.rebuild_sales()
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(f'{name} {count}' for name, count in counts.items())))
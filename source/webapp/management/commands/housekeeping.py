@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp import housekeeping
+
+
+class Command(BaseCommand):
+    help = ('Удаляет истёкшие сессии вместе с их корзинами, корзины без сессии и истёкшие '
+            'AuthToken. Строки удаляются по диапазонам первичного ключа короткими транзакциями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('tasks', nargs='*', help=f'Задачи: {", ".join(housekeeping.TASKS)}; по умолчанию все')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Ключей в одном диапазоне')
+        parser.add_argument('--pause', type=float, default=0, help='Пауза между диапазонами, секунд')
+        parser.add_argument('--loop', action='store_true', help='Повторять постоянно')
+        parser.add_argument('--sleep', type=float, default=60 * 60, help='Пауза между проходами в режиме --loop')
+
+    def handle(self, *args, **options):
+        unknown = set(options['tasks']) - set(housekeeping.TASKS)
+        if unknown:
+            raise CommandError(f'Неизвестные задачи: {", ".join(sorted(unknown))}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть больше нуля')
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        while True:
+            results = housekeeping.run(options['tasks'], options['chunk_size'], options['pause'], log)
+            for name, deleted, elapsed in results:
+                rows = ', '.join(f'{label}: {count}' for label, count in sorted(deleted.items())) or 'нечего удалять'
+                self.stdout.write(f'{name}: {rows} ({elapsed:.2f} с)')
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
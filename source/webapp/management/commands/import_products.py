@@ -0,0 +1,184 @@
+import csv
+import json
+import sys
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from webapp.models import Product, StockShard
+
+
+FIELDS = ('sku', 'name', 'description', 'category', 'amount', 'price')
+UPDATE_FIELDS = ('name', 'description', 'category', 'amount', 'price')
+
+
+class Command(BaseCommand):
+    help = ('Потоковый импорт товаров из CSV или JSONL с обновлением по артикулу (sku). '
+            'Строки без артикула обновляют существующий товар по id (как в export_products)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или "-" для stdin')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--strict', action='store_true', help='Остановиться на первой ошибке')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('jsonl' if options['path'].endswith('.jsonl') else 'csv')
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8', newline='')
+        created = updated = errors = 0
+        try:
+            rows = self.read_rows(stream, file_format)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                products, by_pk, batch_errors = self.build_products(batch)
+                by_pk, missing = self.find_by_pk(by_pk)
+                batch_errors += missing
+                for line, message in sorted(batch_errors):
+                    self.stderr.write(f'Строка {line}: {message}')
+                    if options['strict']:
+                        raise CommandError('Импорт остановлен на ошибке')
+                errors += len(batch_errors)
+                sharded_amounts = self.split_sharded_amounts(products + by_pk)
+                batch_created, batch_updated = self.save_batch(products)
+                if by_pk:
+                    Product.objects.bulk_update(by_pk, UPDATE_FIELDS)
+                for pk, amount in sharded_amounts.items():
+                    StockShard.rebalance(pk, amount=amount)
+                created += batch_created
+                updated += batch_updated + len(by_pk)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(f'Создано: {created}, обновлено: {updated}, ошибок: {errors}')
+
+    def read_rows(self, stream, file_format):
+        if file_format == 'csv':
+            # номер строки с учётом заголовка
+            for line, row in enumerate(csv.DictReader(stream), start=2):
+                yield line, row
+            return
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield line, e
+                continue
+            yield line, row
+
+    def build_products(self, batch):
+        # проверка теми же валидаторами, что и в модели (MinValueValidator, CATEGORY_CHOICES);
+        # уникальность sku обеспечивает upsert, поэтому validate_unique не нужен
+        # Товары без артикула (заведённые до sku) обновляются по id; создать
+        # такой товар импортом нельзя
+        products = {}
+        by_pk = {}
+        errors = []
+        for line, row in batch:
+            if not isinstance(row, dict):
+                errors.append((line, f'Не удалось разобрать строку: {row}'))
+                continue
+            data = {field: row.get(field) for field in FIELDS if row.get(field) not in (None, '')}
+            pk = None
+            if not data.get('sku'):
+                try:
+                    pk = int(row.get('id'))
+                except (TypeError, ValueError):
+                    errors.append((line, 'Не указан ни артикул (sku), ни id существующего товара'))
+                    continue
+            product = Product(pk=pk, **data)
+            try:
+                product.full_clean(validate_unique=False)
+            except ValidationError as e:
+                errors.append((line, '; '.join(f'{k}: {", ".join(v)}' for k, v in e.message_dict.items())))
+                continue
+            if pk is None:
+                products[product.sku] = product
+            else:
+                by_pk[pk] = (line, product)
+        return list(products.values()), by_pk, errors
+
+    def find_by_pk(self, by_pk):
+        if not by_pk:
+            return [], []
+        existing = set(Product.objects.filter(pk__in=by_pk.keys()).values_list('pk', flat=True))
+        found = [product for pk, (line, product) in by_pk.items() if pk in existing]
+        missing = [(line, f'Товар id={pk} без артикула не найден')
+                   for pk, (line, product) in by_pk.items() if pk not in existing]
+        return found, missing
+
+    def split_sharded_amounts(self, products):
+        # У товара со слотами amount — сумма слотов, и следующий sync_amounts
+        # затёр бы записанный в строку остаток. Такой товар сохраняется с прежним
+        # amount, а новый остаток раскладывается по слотам. Возвращает {pk: остаток}
+        skus = [product.sku for product in products if product.pk is None]
+        pks = [product.pk for product in products if product.pk is not None]
+        rows = Product.objects.filter(Q(sku__in=skus) | Q(pk__in=pks), stock_shards__gt=0) \
+            .values_list('pk', 'sku', 'amount')
+        by_sku = {sku: (pk, amount) for pk, sku, amount in rows if sku}
+        by_pk = {pk: (pk, amount) for pk, sku, amount in rows}
+        amounts = {}
+        for product in products:
+            found = by_pk.get(product.pk) if product.pk is not None else by_sku.get(product.sku)
+            if found is None:
+                continue
+            pk, amount = found
+            if product.amount != amount:
+                amounts[pk] = product.amount
+                product.amount = amount
+        return amounts
+
+    def save_batch(self, products):
+        if not products:
+            return 0, 0
+        connection = connections[router.db_for_write(Product)]
+        if connection.vendor in ('sqlite', 'postgresql'):
+            return self.upsert_batch(products, connection)
+        with transaction.atomic():
+            existing = dict(Product.objects.filter(sku__in=[p.sku for p in products]).values_list('sku', 'pk'))
+            to_create = []
+            to_update = []
+            for product in products:
+                if product.sku in existing:
+                    product.pk = existing[product.sku]
+                    to_update.append(product)
+                else:
+                    to_create.append(product)
+            Product.objects.bulk_create(to_create)
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+        return len(to_create), len(to_update)
+
+    def upsert_batch(self, products, connection):
+        # INSERT ... ON CONFLICT (sku) DO UPDATE одним executemany; строки без
+        # изменений не переписываются, поэтому не трогают и поисковый индекс
+        qn = connection.ops.quote_name
+        table = qn(Product._meta.db_table)
+        fields = [Product._meta.get_field(name) for name in FIELDS]
+        update_columns = [qn(Product._meta.get_field(name).column) for name in UPDATE_FIELDS]
+        updated_at = Product._meta.get_field('updated_at')
+        # новые товары заводятся без слотов остатка; у существующих stock_shards не меняется
+        stock_shards = Product._meta.get_field('stock_shards')
+        distinct = 'IS NOT' if connection.vendor == 'sqlite' else 'IS DISTINCT FROM'
+        sql = (
+            f'INSERT INTO {table} ({", ".join(qn(f.column) for f in fields + [updated_at, stock_shards])}) '
+            f'VALUES ({", ".join(["%s"] * (len(fields) + 2))}) '
+            f'ON CONFLICT ({qn(Product._meta.get_field("sku").column)}) DO UPDATE SET '
+            f'{", ".join(f"{c} = excluded.{c}" for c in update_columns + [qn(updated_at.column)])} '
+            f'WHERE {" OR ".join(f"{table}.{c} {distinct} excluded.{c}" for c in update_columns)}'
+        )
+        now = updated_at.get_db_prep_save(timezone.now(), connection)
+        params = [[f.get_db_prep_save(getattr(product, f.attname), connection) for f in fields] + [now, 0]
+                  for product in products]
+        with transaction.atomic(using=connection.alias):
+            existing = Product.objects.using(connection.alias).filter(sku__in=[p.sku for p in products]).count()
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+        Product.objects.catalog_changed()
+        return len(products) - existing, existing
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from webapp.perf import perf_stats
+from webapp.product_cache import product_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает время ответа по именам URL, собранное PerformanceMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=None, help='Только последние N минут')
+        parser.add_argument('--json', action='store_true', help='Вывести сводку в JSON')
+        parser.add_argument('--reset', action='store_true', help='Очистить накопленную статистику')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            perf_stats.reset()
+            product_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Статистика очищена'))
+            return
+        stats = perf_stats.collect(options['minutes'])
+        cache_stats = product_cache.stats()
+        if options['json']:
+            self.stdout.write(json.dumps({'views': stats, 'product_cache': cache_stats}, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(
+            f'Кэш товаров: в процессе {cache_stats["local_hits"]}, в общем кэше {cache_stats["shared_hits"]}, '
+            f'из базы {cache_stats["misses"]}, попаданий {cache_stats["hit_rate"]}')
+        if not stats:
+            self.stdout.write('Данных пока нет (с локальным кэшем статистика видна только внутри процесса)')
+            return
+        header = f'{"view":<30} {"count":>7} {"avg":>8} {"p50":>6} {"p95":>6} {"p99":>6} {"max":>8} {"sql":>8} {"q":>6} {"tpl":>8}'
+        self.stdout.write(header)
+        for name, row in stats.items():
+            self.stdout.write(
+                f'{name:<30} {row["count"]:>7} {row["avg_ms"]:>8} {row["p50_ms"]:>6} {row["p95_ms"]:>6} '
+                f'{row["p99_ms"]:>6} {row["max_ms"]:>8} {row["avg_sql_ms"]:>8} {row["avg_queries"]:>6} '
+                f'{row["avg_template_ms"]:>8}'
+            )
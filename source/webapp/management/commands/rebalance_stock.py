@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.models import Product, StockShard
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает остаток товаров по слотам StockShard поровну и пересчитывает '
+            'Product.amount. --shards N переводит товары на N слотов, --shards 0 — обратно на amount')
+
+    def add_arguments(self, parser):
+        parser.add_argument('products', nargs='*', type=int, help='pk товаров; по умолчанию все товары со слотами')
+        parser.add_argument('--shards', type=int, default=None, help='Новое число слотов')
+        parser.add_argument('--sync-only', action='store_true',
+                            help='Только пересчитать amount по слотам, не перекладывая остаток')
+
+    def handle(self, *args, **options):
+        shards = options['shards']
+        if shards is not None and not 0 <= shards <= 256:
+            raise CommandError('--shards должен быть от 0 до 256')
+        products = Product.objects.all()
+        if options['products']:
+            products = products.filter(pk__in=options['products'])
+        elif shards is None or options['sync_only']:
+            products = products.filter(stock_shards__gt=0)
+        else:
+            raise CommandError('Укажите pk товаров, которые нужно перевести на слоты')
+        if options['sync_only']:
+            rows = products.sync_amounts()
+            self.stdout.write(self.style.SUCCESS(f'Остаток пересчитан у {rows} товаров'))
+            return
+        count = 0
+        for pk in products.order_by('pk').values_list('pk', flat=True).iterator():
+            total = StockShard.rebalance(pk, shards)
+            self.stdout.write(f'{pk}: {total}')
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Перераспределено товаров: {count}'))
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from webapp.models import DailyProductSales, DailyCategorySales
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает продажи по дням (товары и категории) из строк заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Первый день, ГГГГ-ММ-ДД')
+        parser.add_argument('--to', dest='date_to', help='Последний день, ГГГГ-ММ-ДД')
+
+    def parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Неверная дата: {value}')
+
+    def handle(self, *args, **options):
+        date_from = self.parse_date(options['date_from'])
+        date_to = self.parse_date(options['date_to'])
+        with transaction.atomic():
+            products = DailyProductSales.rebuild(date_from, date_to)
+            categories = DailyCategorySales.rebuild(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(
+            f'Продажи пересчитаны: {len(products)} строк по товарам, {len(categories)} по категориям'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from webapp.search import product_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт полнотекстовый индекс товаров (триггеры и содержимое)'
+
+    def handle(self, *args, **options):
+        product_search_index.install()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс товаров перестроен'))
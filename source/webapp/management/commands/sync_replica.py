@@ -0,0 +1,27 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.database import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = ('Копирует базу default в файл реплики через backup API SQLite. '
+            'Только для локальной проверки маршрутизации чтений')
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if REPLICA_ALIAS not in databases:
+            raise CommandError('Реплика не настроена: задайте DB_REPLICA_NAME')
+        default, replica = databases['default'], databases[REPLICA_ALIAS]
+        if not (default['ENGINE'].endswith('sqlite3') and replica['ENGINE'].endswith('sqlite3')):
+            raise CommandError('sync_replica работает только с двумя файлами SQLite')
+        source = sqlite3.connect(default['NAME'])
+        target = sqlite3.connect(replica['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f'{default["NAME"]} скопирована в {replica["NAME"]}'))
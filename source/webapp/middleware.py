@@ -0,0 +1,12 @@
+from webapp.cart import get_cart_backend
+
+
+class CartMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cart_class = get_cart_backend()
+
+    def __call__(self, request):
+        request.cart = self.cart_class(request)
+        response = self.get_response(request)
+        return request.cart.process_response(response)
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def delete_orphan_order_products(apps, schema_editor):
+    # SQLite не проверял внешние ключи, и в старых базах остались строки заказов
+    # без заказа или товара; с ними не проходит проверка ограничений после миграции
+    Order = apps.get_model('webapp', 'Order')
+    Product = apps.get_model('webapp', 'Product')
+    OrderProduct = apps.get_model('webapp', 'OrderProduct')
+    db_alias = schema_editor.connection.alias
+    OrderProduct.objects.using(db_alias).exclude(order__in=Order.objects.using(db_alias).all()).delete()
+    OrderProduct.objects.using(db_alias).exclude(product__in=Product.objects.using(db_alias).all()).delete()
+
+
+def install_search_index(apps, schema_editor):
+    from webapp.search import product_search_index
+    product_search_index.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from webapp.search import product_search_index
+    product_search_index.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_orphan_order_products, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
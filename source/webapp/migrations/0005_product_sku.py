@@ -0,0 +1,25 @@
+# Generated by Django 2.2.13 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+def install_search_index(apps, schema_editor):
+    # SQLite пересоздаёт таблицу товаров при AddField и теряет триггеры индекса
+    from webapp.search import product_search_index
+    product_search_index.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0004_order_user_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Артикул'),
+        ),
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.13 on 2026-10-18 09:53
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def install_search_index(apps, schema_editor):
+    # SQLite пересоздаёт таблицу товаров при AddField и теряет триггеры индекса
+    from webapp.search import product_search_index
+    product_search_index.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0007_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, help_text='0 — остаток хранится в самом товаре', verbose_name='Слотов остатка'),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Слот')),
+                ('amount', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Остаток')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='webapp.Product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Слот остатка',
+                'verbose_name_plural': 'Слоты остатка',
+                'unique_together': {('product', 'slot')},
+            },
+        ),
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
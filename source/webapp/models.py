@@ -1,9 +1,20 @@
+import random
+import threading
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.cache import cache
+from django.db import connections, models, router, transaction
 from django.core.validators import MinValueValidator
-from django.db.models import Sum, F, ExpressionWrapper as E
+from django.db.models import Sum, F, Max, Case, When, Value, OuterRef, Subquery, ExpressionWrapper as E
+from django.db.models.functions import Coalesce, TruncDate
 from django.contrib.sessions.models import Session
 
+from django.utils import timezone
+
+from webapp.cache import bump_catalog_version
+from webapp.product_cache import product_cache
+
 
 DEFAULT_CATEGORY = 'other'
 CATEGORY_CHOICES = (
@@ -15,13 +26,131 @@ CATEGORY_CHOICES = (
 )
 
 
+class _PartialStock(Exception):
+    pass
+
+
+class ProductQuerySet(models.QuerySet):
+    # массовые операции не шлют сигналы post_save, поэтому версию каталога
+    # для кэша страниц и метки кэша товаров меняем здесь
+
+    def update(self, **kwargs):
+        # какие товары изменились, неизвестно: сбрасывается кэш всех товаров
+        return self.update_products(None, **kwargs)
+
+    def update_products(self, pks, **kwargs):
+        # update, при котором меняются только товары pks
+        # auto_now не срабатывает в UPDATE, поэтому updated_at ставим сами
+        kwargs.setdefault('updated_at', timezone.now())
+        rows = super().update(**kwargs)
+        if rows:
+            self.catalog_changed(pks)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if 'updated_at' not in fields:
+            updated_at = timezone.now()
+            for obj in objs:
+                obj.updated_at = updated_at
+            fields = list(fields) + ['updated_at']
+        super().bulk_update(objs, fields, batch_size=batch_size)
+        if objs:
+            self.catalog_changed([obj.pk for obj in objs])
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False):
+        objs = super().bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        if objs:
+            # новых товаров в кэше ещё нет
+            self.catalog_changed([])
+        return objs
+
+    def catalog_changed(self, pks=None):
+        # версия поднимается сразу и ещё раз после коммита: страница, собранная
+        # между ними по старым данным, легла бы под новую версию до конца TTL
+        bump_catalog_version()
+        transaction.on_commit(bump_catalog_version, using=router.db_for_write(self.model))
+        product_cache.invalidate(pks)
+
+    def last_modified(self):
+        # MAX по индексу updated_at — один переход по индексу, без чтения таблицы
+        return self.order_by().aggregate(last_modified=Max('updated_at'))['last_modified']
+
+    def decrement_stock(self, quantities, sharded=None):
+        # quantities: {pk товара: количество}. Остаток уменьшается прямо в UPDATE
+        # с условием amount >= qty, поэтому параллельные заказы не затирают друг друга.
+        # У товаров с stock_shards > 0 списание идёт из слотов StockShard; sharded —
+        # их pk, если товары уже загружены (иначе узнаём запросом).
+        # Возвращает множество pk, которые удалось списать.
+        quantities = {pk: qty for pk, qty in quantities.items() if qty > 0}
+        if not quantities:
+            return set()
+        if sharded is None:
+            sharded = self.filter(pk__in=quantities.keys(), stock_shards__gt=0).values_list('pk', flat=True)
+        sharded = set(sharded) & set(quantities)
+        filled = set()
+        for pk in sharded:
+            left = StockShard.take(pk, quantities.pop(pk), using=self.db)
+            if left is not None:
+                filled.add(pk)
+                self.schedule_amount_sync(pk, force=left <= 0)
+        return filled | self.decrement_amount(quantities)
+
+    def decrement_amount(self, quantities):
+        if not quantities:
+            return set()
+        # stock_shards=0: если товар успели перевести на слоты, amount уже не главный
+        qty_expr = Case(*[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+                        output_field=models.IntegerField())
+        try:
+            with transaction.atomic(using=self.db):
+                rows = self.filter(pk__in=quantities.keys(), stock_shards=0, amount__gte=qty_expr) \
+                    .update_products(quantities.keys(), amount=F('amount') - qty_expr)
+                if rows != len(quantities):
+                    raise _PartialStock()
+            return set(quantities)
+        except _PartialStock:
+            pass
+        filled = set()
+        for pk, qty in quantities.items():
+            if self.filter(pk=pk, stock_shards=0, amount__gte=qty).update_products([pk], amount=F('amount') - qty):
+                filled.add(pk)
+        return filled
+
+    def schedule_amount_sync(self, pk, force=False):
+        # amount товара со слотами обновляется после коммита и не чаще раза
+        # в STOCK_SYNC_INTERVAL секунд, иначе строка товара снова станет общей
+        # точкой записи. Списания внутри окна не теряются: первое из них
+        # планирует ещё одну синхронизацию через интервал. Когда слоты почти
+        # пусты, обновляем сразу, чтобы товар вовремя пропал из наличия
+        interval = getattr(settings, 'STOCK_SYNC_INTERVAL', 5)
+        if force or cache.add(f'stock-sync:{pk}', 1, interval):
+            queryset = self.filter(pk=pk)
+            transaction.on_commit(lambda: queryset.sync_amounts([pk]), using=self.db)
+        elif cache.add(f'stock-sync-later:{pk}', 1, interval):
+            using = self.db
+            transaction.on_commit(lambda: sync_amounts_later([pk], interval, using), using=using)
+
+    def sync_amounts(self, pks=None):
+        # amount = сумма слотов; товары без слотов не трогаются
+        shard_total = StockShard.objects.filter(product=OuterRef('pk')).order_by() \
+            .values('product').annotate(total=Sum('amount')).values('total')
+        return self.filter(stock_shards__gt=0).update_products(
+            pks, amount=Coalesce(Subquery(shard_total, output_field=models.IntegerField()), 0))
+
+
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name='Артикул')
     name = models.CharField(max_length=100, verbose_name='Название')
     description = models.TextField(max_length=2000, null=True, blank=True, verbose_name='Описание')
     category = models.CharField(max_length=20, verbose_name='Категория',
                                 choices=CATEGORY_CHOICES, default=DEFAULT_CATEGORY)
     amount = models.IntegerField(verbose_name='Остаток', validators=[MinValueValidator(0)])
     price = models.DecimalField(verbose_name='Цена', max_digits=7, decimal_places=2, validators=[MinValueValidator(0)])
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменён')
+    stock_shards = models.PositiveSmallIntegerField(default=0, verbose_name='Слотов остатка',
+                                                    help_text='0 — остаток хранится в самом товаре')
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.name} - {self.amount}'
@@ -29,6 +158,99 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        indexes = [
+            models.Index(fields=['category', 'name', 'id'], name='product_catalog_order_idx'),
+        ]
+
+
+def sync_amounts_later(pks, delay, using=None):
+    # отложенная синхронизация в фоновом потоке; соединение потока закрываем сами
+    using = using or router.db_for_write(Product)
+
+    def sync():
+        try:
+            Product.objects.using(using).filter(pk__in=pks).sync_amounts(pks)
+        finally:
+            connections[using].close()
+
+    timer = threading.Timer(delay, sync)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class StockShard(models.Model):
+    """
+    Остаток популярного товара, разложенный на stock_shards слотов. Заказы
+    списывают из случайного слота, поэтому параллельные покупки одного товара
+    блокируют разные строки, а не одну строку Product. Product.amount для таких
+    товаров — сумма слотов, которую обновляют schedule_amount_sync и rebalance_stock.
+    """
+    product = models.ForeignKey('webapp.Product', on_delete=models.CASCADE,
+                                verbose_name='Товар', related_name='shards')
+    slot = models.PositiveSmallIntegerField(verbose_name='Слот')
+    amount = models.IntegerField(verbose_name='Остаток', default=0, validators=[MinValueValidator(0)])
+
+    def __str__(self):
+        return f'{self.product_id} - {self.slot} - {self.amount}'
+
+    @classmethod
+    def take(cls, product_id, qty, using=None):
+        # Списывает qty из слотов товара. Возвращает примерный остаток после
+        # списания или None, если во всех слотах вместе товара не хватило.
+        shards = cls.objects.using(using).filter(product_id=product_id)
+        available = list(shards.filter(amount__gt=0).values_list('slot', 'amount'))
+        random.shuffle(available)
+        left = sum(amount for slot, amount in available) - qty
+        if left < 0:
+            return None
+        # обычно хватает одного слота: одно условное обновление случайной строки
+        for slot, amount in available:
+            if amount >= qty and shards.filter(slot=slot, amount__gte=qty).update(amount=F('amount') - qty):
+                return left
+        # иначе собираем из нескольких слотов; если не хватило — откатываем всё
+        try:
+            with transaction.atomic(using=using):
+                remaining = qty
+                for slot, amount in available:
+                    current = shards.filter(slot=slot).values_list('amount', flat=True).first() or 0
+                    part = min(current, remaining)
+                    if part > 0 and shards.filter(slot=slot, amount__gte=part).update(amount=F('amount') - part):
+                        remaining -= part
+                    if not remaining:
+                        return left
+                raise _PartialStock()
+        except _PartialStock:
+            return None
+
+    @classmethod
+    def rebalance(cls, product_id, shards=None, amount=None, delta=0):
+        # Переносит остаток в shards слотов поровну (None — прежнее число слотов,
+        # 0 — обратно в Product.amount); amount задаёт новый остаток вместо текущего,
+        # delta — изменение текущего (не ниже нуля). Строки товара и слотов
+        # блокируются, так что параллельные заказы ждут окончания перераскладки.
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(pk=product_id)
+            rows = list(cls.objects.select_for_update().filter(product=product))
+            if amount is not None:
+                total = amount
+            else:
+                total = sum(row.amount for row in rows) if product.stock_shards else product.amount
+            if delta:
+                total = max(0, total + delta)
+            shards = product.stock_shards if shards is None else shards
+            cls.objects.filter(product=product).delete()
+            if shards:
+                share, extra = divmod(total, shards)
+                cls.objects.bulk_create([cls(product=product, slot=slot, amount=share + (slot < extra))
+                                         for slot in range(shards)])
+            Product.objects.filter(pk=product.pk).update_products([product.pk], amount=total, stock_shards=shards)
+            return total
+
+    class Meta:
+        verbose_name = 'Слот остатка'
+        verbose_name_plural = 'Слоты остатка'
+        unique_together = ('product', 'slot')
 
 
 class Cart(models.Model):
@@ -82,6 +304,9 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_history_idx'),
+        ]
 
 
 class OrderProduct(models.Model):
@@ -90,10 +315,161 @@ class OrderProduct(models.Model):
     order = models.ForeignKey('webapp.Order', on_delete=models.CASCADE,
                               verbose_name='Заказ', related_name='order_products')
     qty = models.IntegerField(verbose_name='Количество')
+    price = models.DecimalField(verbose_name='Цена', max_digits=7, decimal_places=2,
+                                validators=[MinValueValidator(0)])
 
     def __str__(self):
         return f'{self.product.name} - {self.order.name} - {self.order.format_time()}'
 
+    @property
+    def total(self):
+        return self.price * self.qty
+
     class Meta:
         verbose_name = 'Товар в заказе'
         verbose_name_plural = 'Товары в заказе'
+
+
+class SalesRollup(models.Model):
+    """
+    Продажи, заранее сложенные по дням. Строки добавляются в момент оформления
+    заказа (add_lines), поэтому отчёты читают сотни строк вместо всех OrderProduct.
+    Удаление и правка заказов сюда не попадают — для этого есть rebuild_sales.
+    """
+    key_field = None
+
+    day = models.DateField(verbose_name='День')
+    qty = models.IntegerField(verbose_name='Количество', default=0)
+    revenue = models.DecimalField(verbose_name='Выручка', max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def get_key(cls, line):
+        raise NotImplementedError
+
+    @classmethod
+    def add_lines(cls, lines, day=None):
+        # lines — OrderProduct с заполненной ценой; day по умолчанию — сегодня
+        # в часовом поясе сайта
+        day = day or timezone.localdate()
+        totals = {}
+        for line in lines:
+            key = cls.get_key(line)
+            qty, revenue = totals.get(key, (0, 0))
+            totals[key] = (qty + line.qty, revenue + line.price * line.qty)
+        if not totals:
+            return
+        connection = connections[router.db_for_write(cls)]
+        if connection.vendor in ('sqlite', 'postgresql'):
+            cls.upsert(connection, day, totals)
+            return
+        with transaction.atomic(using=connection.alias):
+            for key, (qty, revenue) in totals.items():
+                filters = {'day': day, cls.key_field: key}
+                rows = cls.objects.using(connection.alias).filter(**filters) \
+                    .update(qty=F('qty') + qty, revenue=F('revenue') + revenue)
+                if not rows:
+                    cls.objects.using(connection.alias).create(qty=qty, revenue=revenue, **filters)
+
+    @classmethod
+    def upsert(cls, connection, day, totals):
+        # INSERT ... ON CONFLICT (day, ключ) DO UPDATE прибавляет к уже
+        # накопленным значениям: параллельные заказы не теряют друг друга
+        qn = connection.ops.quote_name
+        opts = cls._meta
+        day_field, key_field = opts.get_field('day'), opts.get_field(cls.key_field)
+        qty_field, revenue_field = opts.get_field('qty'), opts.get_field('revenue')
+        qty, revenue = qn(qty_field.column), qn(revenue_field.column)
+        sql = (
+            f'INSERT INTO {qn(opts.db_table)} ({qn(day_field.column)}, {qn(key_field.column)}, {qty}, {revenue}) '
+            f'VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT ({qn(day_field.column)}, {qn(key_field.column)}) DO UPDATE SET '
+            f'{qty} = {qn(opts.db_table)}.{qty} + excluded.{qty}, '
+            f'{revenue} = {qn(opts.db_table)}.{revenue} + excluded.{revenue}'
+        )
+        params = [[day_field.get_db_prep_save(day, connection), key,
+                   qty_value, revenue_field.get_db_prep_save(revenue_value, connection)]
+                  for key, (qty_value, revenue_value) in totals.items()]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+class DailyProductSales(SalesRollup):
+    key_field = 'product_id'
+
+    product = models.ForeignKey('webapp.Product', on_delete=models.CASCADE,
+                                verbose_name='Товар', related_name='daily_sales')
+
+    def __str__(self):
+        return f'{self.day} - {self.product_id} - {self.qty}'
+
+    @classmethod
+    def get_key(cls, line):
+        return line.product_id
+
+    @classmethod
+    def rebuild(cls, date_from=None, date_to=None):
+        # пересчёт из строк заказов; день берётся в часовом поясе сайта
+        lines = OrderProduct.objects.annotate(day=TruncDate('order__created_at'))
+        rows = cls.objects.all()
+        if date_from:
+            lines = lines.filter(day__gte=date_from)
+            rows = rows.filter(day__gte=date_from)
+        if date_to:
+            lines = lines.filter(day__lte=date_to)
+            rows = rows.filter(day__lte=date_to)
+        totals = lines.order_by().values('day', 'product_id') \
+            .annotate(total_qty=Sum('qty'), total_revenue=Sum(F('qty') * F('price'),
+                                                              output_field=models.DecimalField()))
+        rows.delete()
+        return cls.objects.bulk_create(
+            [cls(day=row['day'], product_id=row['product_id'], qty=row['total_qty'], revenue=row['total_revenue'])
+             for row in totals.iterator()],
+            batch_size=500,
+        )
+
+    class Meta:
+        verbose_name = 'Продажи товара за день'
+        verbose_name_plural = 'Продажи товаров по дням'
+        unique_together = ('day', 'product')
+
+
+class DailyCategorySales(SalesRollup):
+    key_field = 'category'
+
+    category = models.CharField(max_length=20, verbose_name='Категория', choices=CATEGORY_CHOICES)
+
+    def __str__(self):
+        return f'{self.day} - {self.category} - {self.qty}'
+
+    @classmethod
+    def get_key(cls, line):
+        return line.product.category
+
+    @classmethod
+    def rebuild(cls, date_from=None, date_to=None):
+        # собирается из уже пересчитанных продаж по товарам, а не из заказов
+        product_rows = DailyProductSales.objects.all()
+        rows = cls.objects.all()
+        if date_from:
+            product_rows = product_rows.filter(day__gte=date_from)
+            rows = rows.filter(day__gte=date_from)
+        if date_to:
+            product_rows = product_rows.filter(day__lte=date_to)
+            rows = rows.filter(day__lte=date_to)
+        totals = product_rows.order_by().values('day', 'product__category') \
+            .annotate(total_qty=Sum('qty'), total_revenue=Sum('revenue'))
+        rows.delete()
+        return cls.objects.bulk_create(
+            [cls(day=row['day'], category=row['product__category'], qty=row['total_qty'],
+                 revenue=row['total_revenue'])
+             for row in totals.iterator()],
+            batch_size=500,
+        )
+
+    class Meta:
+        verbose_name = 'Продажи категории за день'
+        verbose_name_plural = 'Продажи категорий по дням'
+        unique_together = ('day', 'category')
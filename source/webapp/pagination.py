@@ -0,0 +1,196 @@
+import datetime
+import decimal
+import hashlib
+import json
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+
+
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+CURSOR_LAST = 'l'
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorSerializer:
+    # в отличие от DjangoJSONEncoder сохраняет микросекунды: при усечении
+    # времени строки с близкими created_at выпадали бы между страницами
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), default=self.default).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+    def default(self, value):
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        raise TypeError(f'{type(value).__name__} нельзя сохранить в курсоре')
+
+
+class CursorPaginator:
+    """
+    Постраничный вывод по ключу (seek): вместо OFFSET следующая страница
+    выбирается условием "строго после последней строки" по полям ordering,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+
+    Поля ordering должны быть NOT NULL и вместе однозначно задавать порядок
+    (последним полем обычно идёт pk).
+    """
+    is_cursor = True
+    salt = 'webapp.pagination.cursor'
+
+    def __init__(self, object_list, per_page, ordering, count_mode=COUNT_ESTIMATE, count_timeout=300):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_mode = count_mode
+        self.count_timeout = count_timeout
+
+    @property
+    def count(self):
+        if self.count_mode == COUNT_EXACT:
+            return self.object_list.count()
+        if self.count_mode == COUNT_ESTIMATE:
+            return self.get_estimated_count()
+        return None
+
+    @property
+    def num_pages(self):
+        count = self.count
+        if count is None:
+            return None
+        return max(1, -(-count // self.per_page))
+
+    def get_estimated_count(self):
+        # точное число строк не нужно для навигации, поэтому COUNT(*)
+        # выполняется не чаще раза в count_timeout секунд для одного запроса
+        sql = str(self.object_list.query).encode()
+        key = 'cursor-count:' + hashlib.md5(sql).hexdigest()
+        return cache.get_or_set(key, self.object_list.count, self.count_timeout)
+
+    def encode_cursor(self, obj, direction):
+        values = [self.get_value(obj, field) for field in self.get_fields()]
+        return self.dump_token(direction, values)
+
+    def dump_token(self, direction, values):
+        return signing.dumps([direction, values], salt=self.salt, serializer=CursorSerializer, compress=True)
+
+    def decode_cursor(self, token):
+        try:
+            direction, values = signing.loads(token, salt=self.salt, serializer=CursorSerializer)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor('Неверная ссылка на страницу')
+        if direction not in (CURSOR_NEXT, CURSOR_PREVIOUS, CURSOR_LAST):
+            raise InvalidCursor('Неверная ссылка на страницу')
+        if direction != CURSOR_LAST and len(values) != len(self.ordering):
+            raise InvalidCursor('Неверная ссылка на страницу')
+        return direction, values
+
+    def last_cursor(self):
+        return self.dump_token(CURSOR_LAST, [])
+
+    def get_fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def get_value(self, obj, field):
+        return getattr(obj, field)
+
+    def get_ordering(self, reverse=False):
+        ordering = []
+        for field in self.ordering:
+            descending = field.startswith('-')
+            if reverse:
+                descending = not descending
+            ordering.append(('-' if descending else '') + field.lstrip('-'))
+        return ordering
+
+    def get_seek_query(self, values, reverse=False):
+        # (a, b, c) > (x, y, z)  =>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        query = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            query |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return query
+
+    def page(self, token=None):
+        direction = CURSOR_NEXT
+        values = None
+        if token:
+            direction, values = self.decode_cursor(token)
+        reverse = direction in (CURSOR_PREVIOUS, CURSOR_LAST)
+        queryset = self.object_list.order_by(*self.get_ordering(reverse=reverse))
+        if values:
+            queryset = queryset.filter(self.get_seek_query(values, reverse=reverse))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            has_next = direction == CURSOR_PREVIOUS
+            has_previous = has_more
+        else:
+            has_next = has_more
+            has_previous = values is not None
+        return CursorPage(rows, self, has_next, has_previous)
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1], CURSOR_NEXT)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], CURSOR_PREVIOUS)
+        return None
+
+    @property
+    def last_cursor(self):
+        return self.paginator.last_cursor()
@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+# верхние границы корзин гистограммы, мс; последняя корзина — всё, что дольше
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+PERF_CACHE_PREFIX = 'perf-stats'
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+def get_perf_setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestTimer:
+    # счётчики одного запроса; execute_wrapper вызывается на каждый SQL-запрос
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_start = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+    def template_started(self):
+        self.template_start = time.perf_counter()
+
+    def template_finished(self, response):
+        if self.template_start is not None:
+            self.template_time += time.perf_counter() - self.template_start
+            self.template_start = None
+
+
+class ViewStats:
+    __slots__ = ('count', 'total', 'sql', 'queries', 'template', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.sql = 0.0
+        self.queries = 0
+        self.template = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, total, sql, queries, template):
+        self.count += 1
+        self.total += total
+        self.sql += sql
+        self.queries += queries
+        self.template += template
+        self.max = max(self.max, total)
+        self.histogram[bisect_left(HISTOGRAM_BOUNDS, total)] += 1
+
+    def merge(self, data):
+        self.count += data['count']
+        self.total += data['total']
+        self.sql += data['sql']
+        self.queries += data['queries']
+        self.template += data['template']
+        self.max = max(self.max, data['max'])
+        self.histogram = [a + b for a, b in zip(self.histogram, data['histogram'])]
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def percentile(self, q):
+        # верхняя граница корзины, в которую попал q-й процентиль
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return HISTOGRAM_BOUNDS[index] if index < len(HISTOGRAM_BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        count = self.count or 1
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / count, 2),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max, 2),
+            'avg_queries': round(self.queries / count, 2),
+            'avg_sql_ms': round(self.sql / count, 2),
+            'avg_template_ms': round(self.template / count, 2),
+            'histogram': dict(zip([str(b) for b in HISTOGRAM_BOUNDS] + ['inf'], self.histogram)),
+        }
+
+
+class PerfStats:
+    """
+    Скользящие гистограммы времени ответа по именам URL. Время делится на окна
+    по PERF_WINDOW секунд, хранятся последние PERF_WINDOWS окон. Запись идёт
+    в память процесса; раз в PERF_FLUSH_INTERVAL секунд процесс кладёт свой
+    снимок в кэш, откуда страница статистики и perf_stats собирают все процессы.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.last_flush = time.monotonic()
+        self.worker = f'{os.uname().nodename}:{os.getpid()}'
+
+    @property
+    def window(self):
+        return get_perf_setting('PERF_WINDOW', 60)
+
+    @property
+    def window_count(self):
+        return get_perf_setting('PERF_WINDOWS', 15)
+
+    def current_window(self):
+        return int(time.time() // self.window) * self.window
+
+    def record(self, view_name, total, sql, queries, template):
+        window = self.current_window()
+        with self.lock:
+            views = self.windows.setdefault(window, {})
+            stats = views.get(view_name)
+            if stats is None:
+                stats = views[view_name] = ViewStats()
+            stats.add(total, sql, queries, template)
+            flush = time.monotonic() - self.last_flush >= get_perf_setting('PERF_FLUSH_INTERVAL', 10)
+            if flush:
+                self.last_flush = time.monotonic()
+                snapshot = self.snapshot()
+        if flush:
+            self.flush(snapshot)
+
+    def snapshot(self):
+        oldest = self.current_window() - self.window * (self.window_count - 1)
+        for window in [w for w in self.windows if w < oldest]:
+            del self.windows[window]
+        return {window: {name: stats.as_dict() for name, stats in views.items()}
+                for window, views in self.windows.items()}
+
+    def flush(self, snapshot=None):
+        if snapshot is None:
+            with self.lock:
+                snapshot = self.snapshot()
+        timeout = self.window * self.window_count
+        cache.set(f'{PERF_CACHE_PREFIX}:{self.worker}', snapshot, timeout)
+        workers = cache.get(f'{PERF_CACHE_PREFIX}:workers') or set()
+        if self.worker not in workers:
+            workers.add(self.worker)
+            cache.set(f'{PERF_CACHE_PREFIX}:workers', workers, None)
+
+    def collect(self, minutes=None):
+        # сводка по всем процессам за последние minutes минут (по умолчанию — всё окно)
+        self.flush()
+        horizon = self.window * self.window_count
+        if minutes:
+            horizon = min(horizon, minutes * 60)
+        oldest = self.current_window() - horizon + self.window
+        workers = cache.get(f'{PERF_CACHE_PREFIX}:workers') or set()
+        snapshots = cache.get_many([f'{PERF_CACHE_PREFIX}:{worker}' for worker in workers])
+        merged = {}
+        for snapshot in snapshots.values():
+            for window, views in snapshot.items():
+                if window < oldest:
+                    continue
+                for name, data in views.items():
+                    merged.setdefault(name, ViewStats()).merge(data)
+        return {name: stats.summary() for name, stats in sorted(merged.items())}
+
+    def reset(self):
+        with self.lock:
+            self.windows = {}
+        workers = cache.get(f'{PERF_CACHE_PREFIX}:workers') or set()
+        cache.delete_many([f'{PERF_CACHE_PREFIX}:{worker}' for worker in workers])
+        cache.delete(f'{PERF_CACHE_PREFIX}:workers')
+
+
+perf_stats = PerfStats()
+
+
+class PerformanceMiddleware:
+    # Ставится первым в MIDDLEWARE, чтобы мерить весь запрос. Шаблон TemplateResponse
+    # рендерится после process_template_response всех middleware, поэтому время
+    # рендера — от нашего process_template_response до post-render колбэка.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_perf_setting('PERF_ENABLED', True):
+            return self.get_response(request)
+        timer = request._perf_timer = RequestTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total = (time.perf_counter() - start) * 1000
+        sql = timer.sql_time * 1000
+        template = timer.template_time * 1000
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else UNRESOLVED_VIEW
+        perf_stats.record(view_name, total, sql, timer.queries, template)
+        if get_perf_setting('PERF_SERVER_TIMING', True):
+            response['Server-Timing'] = (
+                f'db;dur={sql:.1f};desc="{timer.queries} queries", '
+                f'tpl;dur={template:.1f}, '
+                f'total;dur={total:.1f}'
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        timer = getattr(request, '_perf_timer', None)
+        if timer is not None:
+            timer.template_started()
+            response.add_post_render_callback(timer.template_finished)
+        return response
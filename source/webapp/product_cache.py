@@ -0,0 +1,224 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.http import Http404
+
+from webapp.cache import is_cache_shared
+
+
+VERSION_PREFIX = 'product-version'
+GENERATION_KEY = 'product-generation'
+ENTRY_PREFIX = 'product'
+STATS_PREFIX = 'product-cache-stats'
+STATS_FIELDS = ('local_hits', 'shared_hits', 'misses')
+STATS_FLUSH_INTERVAL = 10
+
+
+class LocalLRU:
+    # словарь процесса: не больше maxsize записей, каждая живёт ttl секунд
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class ProductCache:
+    """
+    Товары по pk: сначала LRU процесса, затем общий кэш, затем база.
+
+    У каждого товара в общем кэше есть метка версии, у всего кэша — метка
+    поколения. Запись годится, только если совпадают обе метки, поэтому
+    invalidate (сохранение, удаление, изменение остатка) в одном процессе сразу
+    видна во всех остальных: локальные копии со старой меткой просто не
+    используются. Проверка меток — один get_many к общему кэшу на любой набор
+    товаров, база не читается.
+
+    Метки имеют смысл только в общем кэше: с кэшем процесса (LocMemCache)
+    invalidate из другого процесса не видна, поэтому товары читаются из базы.
+    """
+
+    def __init__(self):
+        self.local = LocalLRU(self.local_size, self.local_ttl)
+        self.counters = dict.fromkeys(STATS_FIELDS, 0)
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def model(self):
+        # модели импортируют этот модуль, поэтому Product берётся из реестра
+        return apps.get_model('webapp', 'Product')
+
+    @property
+    def local_size(self):
+        return getattr(settings, 'PRODUCT_CACHE_LOCAL_SIZE', 1000)
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, 'PRODUCT_CACHE_LOCAL_TTL', 30)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 60 * 5)
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def get_or_404(self, pk):
+        try:
+            product = self.get(int(pk))
+        except (TypeError, ValueError):
+            product = None
+        if product is None:
+            raise Http404('Товар не найден')
+        return product
+
+    def get_many(self, pks):
+        # {pk: Product}; отсутствующих в базе товаров в ответе нет.
+        # Отдаются копии: изменения в одном запросе не попадут в кэш
+        pks = set(pks)
+        if not pks:
+            return {}
+        if not is_cache_shared():
+            self.count('misses', len(pks))
+            return self.load(pks)
+        stamps = self.get_stamps(pks)
+        found, missing = {}, []
+        for pk in pks:
+            product = self.local.get((pk, stamps[pk]))
+            if product is not None:
+                found[pk] = product
+            else:
+                missing.append(pk)
+        self.count('local_hits', len(found))
+        if missing:
+            keys = {self.entry_key(pk, stamps[pk]): pk for pk in missing}
+            for key, product in cache.get_many(keys.keys()).items():
+                pk = keys[key]
+                found[pk] = product
+                self.local.set((pk, stamps[pk]), product)
+            self.count('shared_hits', len(found) - (len(pks) - len(missing)))
+            missing = [pk for pk in missing if pk not in found]
+        if missing:
+            self.count('misses', len(missing))
+            # метки прочитаны до базы: если товар изменится во время чтения,
+            # запись ляжет под старой меткой и не будет использована. Читаем из
+            # default: отставшая реплика оставила бы под новой меткой старый товар
+            loaded = self.load(missing)
+            cache.set_many({self.entry_key(pk, stamps[pk]): product for pk, product in loaded.items()},
+                           self.timeout)
+            for pk, product in loaded.items():
+                self.local.set((pk, stamps[pk]), product)
+            found.update(loaded)
+        return {pk: copy.copy(product) for pk, product in found.items()}
+
+    def load(self, pks):
+        return self.model.objects.using(router.db_for_write(self.model)).in_bulk(pks)
+
+    def entry_key(self, pk, stamp):
+        return f'{ENTRY_PREFIX}:{pk}:{stamp}'
+
+    def version_key(self, pk):
+        return f'{VERSION_PREFIX}:{pk}'
+
+    def get_stamps(self, pks):
+        keys = {self.version_key(pk): pk for pk in pks}
+        values = cache.get_many(list(keys) + [GENERATION_KEY])
+        generation = values.get(GENERATION_KEY) or self.init_key(GENERATION_KEY)
+        stamps = {}
+        for key, pk in keys.items():
+            version = values.get(key) or self.init_key(key)
+            stamps[pk] = f'{generation}:{version}'
+        return stamps
+
+    def init_key(self, key):
+        # метка не должна совпасть с прежней, вытесненной из кэша, поэтому случайная
+        cache.add(key, uuid4().hex[:12], None)
+        return cache.get(key)
+
+    def invalidate(self, pks=None):
+        # pks=None — все товары. Метка меняется сразу и ещё раз после коммита:
+        # иначе процесс, прочитавший товар между ними, сохранит под новой
+        # меткой старые данные
+        keys = [GENERATION_KEY] if pks is None else [self.version_key(pk) for pk in pks]
+        if not keys:
+            return
+
+        def set_new_stamps():
+            cache.set_many({key: uuid4().hex[:12] for key in keys}, None)
+
+        set_new_stamps()
+        transaction.on_commit(set_new_stamps)
+
+    def count(self, field, value):
+        if not value:
+            return
+        with self.lock:
+            self.counters[field] += value
+            if time.monotonic() - self.flushed_at < STATS_FLUSH_INTERVAL:
+                return
+            counters, self.counters = self.counters, dict.fromkeys(STATS_FIELDS, 0)
+            self.flushed_at = time.monotonic()
+        self.flush(counters)
+
+    def flush(self, counters):
+        # счётчики всех процессов складываются в общем кэше
+        for field, value in counters.items():
+            if not value:
+                continue
+            key = f'{STATS_PREFIX}:{field}'
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                if not cache.add(key, value, None):
+                    cache.incr(key, value)
+
+    def stats(self):
+        with self.lock:
+            counters, self.counters = self.counters, dict.fromkeys(STATS_FIELDS, 0)
+            self.flushed_at = time.monotonic()
+        self.flush(counters)
+        values = cache.get_many([f'{STATS_PREFIX}:{field}' for field in STATS_FIELDS])
+        stats = {field: values.get(f'{STATS_PREFIX}:{field}', 0) for field in STATS_FIELDS}
+        total = sum(stats.values())
+        stats['hit_rate'] = round((stats['local_hits'] + stats['shared_hits']) / total, 4) if total else None
+        return stats
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters = dict.fromkeys(STATS_FIELDS, 0)
+        cache.delete_many([f'{STATS_PREFIX}:{field}' for field in STATS_FIELDS])
+
+
+product_cache = ProductCache()
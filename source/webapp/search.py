@@ -0,0 +1,141 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс SQLite FTS5 поверх таблицы модели.
+
+    Индекс — external content таблица, синхронизация делается триггерами,
+    поэтому save(), delete(), bulk_update() и даже сырой SQL его не обходят.
+    На других СУБД поиск откатывается к icontains по тем же полям.
+    """
+    model = None
+    fields = ()
+    tokenize = 'unicode61 remove_diacritics 2'
+    prefix = '2 3'
+    rank_alias = 'search_rank'
+
+    def __init__(self, model=None, fields=None):
+        if model is not None:
+            self.model = model
+        if fields is not None:
+            self.fields = tuple(fields)
+
+    @property
+    def content_table(self):
+        return self.model._meta.db_table
+
+    @property
+    def table(self):
+        return f'{self.content_table}_fts'
+
+    def is_supported(self, connection):
+        return connection.vendor == 'sqlite'
+
+    def get_connection(self, write=False):
+        if write:
+            alias = router.db_for_write(self.model)
+        else:
+            alias = router.db_for_read(self.model)
+        return connections[alias]
+
+    def get_install_sql(self):
+        table = self.table
+        content = self.content_table
+        pk = self.model._meta.pk.column
+        columns = ', '.join(self.fields)
+        new_values = ', '.join(f'new.{field}' for field in self.fields)
+        old_values = ', '.join(f'old.{field}' for field in self.fields)
+        delete_old = (f"INSERT INTO {table}({table}, rowid, {columns}) "
+                      f"VALUES ('delete', old.{pk}, {old_values});")
+        insert_new = f"INSERT INTO {table}(rowid, {columns}) VALUES (new.{pk}, {new_values});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({columns}, "
+            f"content='{content}', content_rowid='{pk}', "
+            f"tokenize='{self.tokenize}', prefix='{self.prefix}')",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {content} BEGIN {insert_new} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {content} BEGIN {delete_old} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {columns} ON {content} "
+            f"BEGIN {delete_old} {insert_new} END",
+        ]
+
+    def get_uninstall_sql(self):
+        table = self.table
+        return [
+            f'DROP TRIGGER IF EXISTS {table}_ai',
+            f'DROP TRIGGER IF EXISTS {table}_ad',
+            f'DROP TRIGGER IF EXISTS {table}_au',
+            f'DROP TABLE IF EXISTS {table}',
+        ]
+
+    def install(self, connection=None):
+        # вызывается из миграций: при пересоздании таблицы модели SQLite
+        # удаляет её триггеры, поэтому установка идемпотентна и пересобирает индекс
+        connection = connection or self.get_connection(write=True)
+        if not self.is_supported(connection):
+            return
+        with connection.cursor() as cursor:
+            for sql in self.get_install_sql():
+                cursor.execute(sql)
+        self.rebuild(connection)
+
+    def uninstall(self, connection=None):
+        connection = connection or self.get_connection(write=True)
+        if not self.is_supported(connection):
+            return
+        with connection.cursor() as cursor:
+            for sql in self.get_uninstall_sql():
+                cursor.execute(sql)
+
+    def rebuild(self, connection=None):
+        connection = connection or self.get_connection(write=True)
+        if not self.is_supported(connection):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def build_match(self, value):
+        # пользовательский ввод не передаём в синтаксис MATCH как есть:
+        # каждое слово становится префиксным термином в кавычках, термины объединяются по AND
+        words = re.findall(r'\w+', value or '')
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def get_fallback_query(self, value):
+        query = Q()
+        for field in self.fields:
+            query = query | Q(**{f'{field}__icontains': value})
+        return query
+
+    def search(self, queryset, value, ranked=True):
+        connection = connections[queryset.db]
+        if not self.is_supported(connection):
+            return queryset.filter(self.get_fallback_query(value))
+        match = self.build_match(value)
+        if not match:
+            return queryset.none()
+        table = self.table
+        queryset = queryset.extra(
+            select={self.rank_alias: f'{table}.rank'},
+            tables=[table],
+            where=[f'{table}.rowid = {self.content_table}.{self.model._meta.pk.column}',
+                   f'{table} MATCH %s'],
+            params=[match],
+        )
+        if ranked:
+            queryset = queryset.order_by(self.rank_alias, *queryset.query.order_by)
+        return queryset
+
+
+class ProductSearchIndex(SearchIndex):
+    fields = ('name', 'description')
+
+    @property
+    def model(self):
+        from webapp.models import Product
+        return Product
+
+
+product_search_index = ProductSearchIndex()
@@ -0,0 +1,165 @@
+import json
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.db import router, transaction
+
+from webapp.cache import is_cache_shared
+
+
+CACHE_KEY_PREFIX = 'session:'
+ACTIVITY_KEY = '_activity'
+# После записи ключ в кэше заменяется меткой со временем записи. Положить сессию
+# обратно в кэш может только процесс, начавший чтение из базы позже этой метки:
+# версия, прочитанная до записи, в кэш не попадёт
+WRITE_MARKER = 'written'
+WRITE_MARKER_TIMEOUT = 60
+
+
+def get_cache_alias():
+    return getattr(settings, 'SESSION_CACHE_ALIAS', 'default')
+
+
+@checks.register(checks.Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    if settings.SESSION_ENGINE != __name__ or is_cache_shared(get_cache_alias()):
+        return []
+    return [checks.Warning(
+        f'{__name__} требует общего для процессов кэша, а CACHES[{get_cache_alias()!r}] — '
+        f'{settings.CACHES[get_cache_alias()]["BACKEND"]}.',
+        hint='Сессии будут читаться из базы без кэша. Настройте memcached или redis.',
+        id='webapp.W001',
+    )]
+
+
+class CompactJSONSerializer:
+    # JSON без пробелов; длинные сессии дополнительно сжимаются zlib.
+    # Данные без префикса читаются как обычный JSON, поэтому старые сессии
+    # JSONSerializer остаются рабочими.
+    compress_min_length = 256
+    compressed_prefix = b'z'
+
+    def dumps(self, obj):
+        data = json.dumps(obj, separators=(',', ':')).encode('latin-1')
+        if len(data) >= self.compress_min_length:
+            compressed = zlib.compress(data, 6)
+            if len(compressed) + 1 < len(data):
+                return self.compressed_prefix + compressed
+        return data
+
+    def loads(self, data):
+        if data[:1] == self.compressed_prefix:
+            data = zlib.decompress(data[1:])
+        return json.loads(data.decode('latin-1'))
+
+
+class SessionStore(DBStore):
+    """
+    Сессии читаются из кэша, а в базу пишутся только изменения. Строка
+    django_session создаётся сразу, поэтому на неё можно ссылаться внешним ключом
+    (Cart.session). Время последней активности обновляется не чаще раза
+    в SESSION_ACTIVITY_INTERVAL секунд, вместе с ним продлевается срок сессии.
+
+    Кэш должен быть общим для всех процессов; с LocMemCache сессии читаются
+    прямо из базы. После записи в базу значение в кэше не перезаписывается,
+    а заменяется меткой, и следующее чтение берёт свежую версию из базы: так
+    параллельные запросы одной сессии не оставляют в кэше чужую копию.
+    """
+
+    def __init__(self, session_key=None):
+        alias = get_cache_alias()
+        # с кэшем в памяти процесса сессия, удалённая в одном процессе, осталась бы
+        # действующей в других, поэтому кэш не используется вовсе (см. webapp.W001)
+        self._cache = caches[alias] if is_cache_shared(alias) else DummyCache('sessions', {})
+        self._loaded_data = None
+        super().__init__(session_key)
+
+    @property
+    def activity_interval(self):
+        return getattr(settings, 'SESSION_ACTIVITY_INTERVAL', 5 * 60)
+
+    def get_cache_key(self, session_key=None):
+        return CACHE_KEY_PREFIX + (session_key or self._get_or_create_session_key())
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.get_cache_key())
+        except Exception:
+            # memcached отвергает некоторые ключи; такая сессия просто не найдётся
+            cached = None
+        if isinstance(cached, tuple) and cached[0] != WRITE_MARKER:
+            session_data, expire_at = cached
+            if expire_at > time.time():
+                return self.touch(self.decode_loaded(session_data))
+            cached = None
+        started = time.time()
+        session = self._get_session_from_db()
+        if session is None:
+            return {}
+        expire_at = session.expire_date.timestamp()
+        value, timeout = (session.session_data, expire_at), self.get_cache_timeout(expire_at)
+        if cached is None:
+            self._cache.add(self.get_cache_key(), value, timeout)
+        elif cached[1] < started:
+            self._cache.set(self.get_cache_key(), value, timeout)
+        return self.touch(self.decode_loaded(session.session_data))
+
+    def decode_loaded(self, session_data):
+        self._loaded_data = session_data
+        return self.decode(session_data)
+
+    def touch(self, data):
+        # метка активности делает сессию изменённой раз в activity_interval
+        now = int(time.time())
+        if data and now - data.get(ACTIVITY_KEY, 0) >= self.activity_interval:
+            data[ACTIVITY_KEY] = now
+            self.modified = True
+        return data
+
+    def get_cache_timeout(self, expire_at):
+        return max(1, int(expire_at - time.time()))
+
+    def exists(self, session_key):
+        cached = self._cache.get(self.get_cache_key(session_key)) if session_key else None
+        if isinstance(cached, tuple) and cached[0] != WRITE_MARKER:
+            return True
+        return super().exists(session_key)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not must_create:
+            data = self._get_session()
+            if self._loaded_data is not None and self.encode(data) == self._loaded_data:
+                # изменений нет (например, тот же ключ записан тем же значением)
+                return
+        super().save(must_create)
+        self._loaded_data = self.encode(self._get_session())
+        self.invalidate_cache(self.session_key)
+
+    def invalidate_cache(self, session_key):
+        # удаляем сразу (внутри внешней транзакции следующее чтение увидит запись),
+        # метку ставим после коммита, когда новая версия видна всем процессам
+        cache_key = self.get_cache_key(session_key)
+        self._cache.delete(cache_key)
+        using = router.db_for_write(self.model)
+        transaction.on_commit(
+            lambda: self._cache.set(cache_key, (WRITE_MARKER, time.time()), WRITE_MARKER_TIMEOUT), using=using)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        super().delete(session_key)
+        self.invalidate_cache(session_key)
+
+    def flush(self):
+        self.clear()
+        self.delete(self.session_key)
+        self._session_key = None
@@ -6,6 +6,25 @@ register = template.Library()
 
 @register.filter
 def page_query_string(request, page_number):
+    # номер страницы или непрозрачный курсор CursorPaginator
     query_args = request.GET.copy()
-    query_args['page'] = page_number
+    if isinstance(page_number, int) or str(page_number).isdigit():
+        query_args.pop('cursor', None)
+        query_args['page'] = page_number
+    else:
+        query_args.pop('page', None)
+        query_args['cursor'] = page_number
+    return query_args.urlencode()
+
+
+@register.simple_tag
+def facet_query_string(request, name, value):
+    # другой фасет — другая выдача, поэтому страница и курсор сбрасываются
+    query_args = request.GET.copy()
+    query_args.pop('page', None)
+    query_args.pop('cursor', None)
+    if value:
+        query_args[name] = str(value)
+    else:
+        query_args.pop(name, None)
     return query_args.urlencode()
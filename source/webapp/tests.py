@@ -1,3 +1,774 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+
+from accounts.models import AuthToken
+from main.database import get_caches, is_shared_cache_config
+from webapp import housekeeping, session_backend
+from webapp.cache import CART_BADGE_PLACEHOLDER, CSRF_PLACEHOLDER, get_catalog_version
+from webapp.models import Cart, Order, OrderProduct, Product, StockShard
+from webapp.product_cache import product_cache
+from webapp.search import product_search_index
+
+
+ORDER_DATA = {'name': 'Покупатель', 'phone': '+996555000000', 'address': 'Бишкек'}
+
+
+class SharedCacheMixin:
+    # FileBasedCache общий для процессов, с ним включаются кэш страниц и сессий
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+
+
+class StockDecrementTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+        self.soap = Product.objects.create(name='Мыло', amount=1, price=3)
+
+    def test_decrements_all_when_enough(self):
+        filled = Product.objects.decrement_stock({self.tea.pk: 2, self.soap.pk: 1})
+        self.assertEqual(filled, {self.tea.pk, self.soap.pk})
+        self.tea.refresh_from_db()
+        self.soap.refresh_from_db()
+        self.assertEqual((self.tea.amount, self.soap.amount), (3, 0))
+
+    def test_partial_fill_leaves_short_product_untouched(self):
+        filled = Product.objects.decrement_stock({self.tea.pk: 2, self.soap.pk: 2})
+        self.assertEqual(filled, {self.tea.pk})
+        self.tea.refresh_from_db()
+        self.soap.refresh_from_db()
+        self.assertEqual((self.tea.amount, self.soap.amount), (3, 1))
+
+    def test_second_decrement_cannot_oversell(self):
+        # второй заказ видит уже уменьшенный остаток, а не прочитанный заранее
+        self.assertEqual(Product.objects.decrement_stock({self.soap.pk: 1}), {self.soap.pk})
+        self.assertEqual(Product.objects.decrement_stock({self.soap.pk: 1}), set())
+        self.soap.refresh_from_db()
+        self.assertEqual(self.soap.amount, 0)
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+        self.soap = Product.objects.create(name='Мыло', amount=2, price=3)
+
+    def add_to_cart(self, product, qty):
+        self.client.post(reverse('webapp:product_add_to_cart', kwargs={'pk': product.pk}), {'qty': qty})
+
+    def test_checkout_decrements_stock_and_snapshots_price(self):
+        self.add_to_cart(self.tea, 2)
+        self.add_to_cart(self.soap, 1)
+        self.client.post(reverse('webapp:order_create'), ORDER_DATA)
+        order = Order.objects.get()
+        lines = {line.product_id: line for line in order.order_products.all()}
+        self.assertEqual(lines[self.tea.pk].qty, 2)
+        self.assertEqual(lines[self.tea.pk].price, 10)
+        self.tea.refresh_from_db()
+        self.soap.refresh_from_db()
+        self.assertEqual((self.tea.amount, self.soap.amount), (3, 1))
+        self.assertEqual(self.client.get(reverse('webapp:cart_view')).context['cart'], [])
+
+    def test_checkout_rejects_oversell(self):
+        self.add_to_cart(self.soap, 2)
+        # пока товар лежал в корзине, его раскупили
+        Product.objects.filter(pk=self.soap.pk).update(amount=1)
+        response = self.client.post(reverse('webapp:order_create'), ORDER_DATA)
+        self.assertRedirects(response, reverse('webapp:cart_view'))
+        self.assertFalse(Order.objects.exists())
+        self.soap.refresh_from_db()
+        self.assertEqual(self.soap.amount, 1)
+        cart = self.client.get(reverse('webapp:cart_view')).context['cart']
+        self.assertEqual([(line.product_id, line.qty) for line in cart], [(self.soap.pk, 2)])
+
+    def test_checkout_keeps_unfilled_lines_in_cart(self):
+        self.add_to_cart(self.tea, 1)
+        self.add_to_cart(self.soap, 2)
+        Product.objects.filter(pk=self.soap.pk).update(amount=1)
+        self.client.post(reverse('webapp:order_create'), ORDER_DATA)
+        self.assertEqual(list(OrderProduct.objects.values_list('product_id', flat=True)), [self.tea.pk])
+        cart = self.client.get(reverse('webapp:cart_view')).context['cart']
+        self.assertEqual([line.product_id for line in cart], [self.soap.pk])
+
+
+class CartApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+        self.soap = Product.objects.create(name='Мыло', amount=2, price=3)
+
+    def post(self, operations, **extra):
+        return self.client.post(reverse('webapp:cart_api'), json.dumps({'operations': operations, **extra}),
+                                content_type='application/json')
+
+    def get_lines(self):
+        data = self.client.get(reverse('webapp:cart_api')).json()
+        return {line['product']: line['qty'] for line in data['lines']}
+
+    def test_batch_add_set_remove(self):
+        response = self.post([
+            {'op': 'add', 'product': self.tea.pk, 'qty': 2},
+            {'op': 'add', 'product': self.soap.pk},
+            {'op': 'add', 'product': self.tea.pk, 'qty': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['errors'], [])
+        self.assertEqual((data['count'], data['total']), (4, '33.00'))
+        self.post([{'op': 'set', 'product': self.tea.pk, 'qty': 1}, {'op': 'remove', 'product': self.soap.pk}])
+        self.assertEqual(self.get_lines(), {self.tea.pk: 1})
+
+    def test_invalid_operations_are_reported_and_skipped(self):
+        data = self.post([
+            {'op': 'add', 'product': self.tea.pk, 'qty': 1},
+            {'op': 'add', 'product': self.soap.pk, 'qty': 3},
+            {'op': 'drop', 'product': self.tea.pk},
+            {'op': 'add', 'product': 999999},
+        ]).json()
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2, 3])
+        self.assertEqual(self.get_lines(), {self.tea.pk: 1})
+
+    def test_atomic_batch_is_rejected_as_a_whole(self):
+        response = self.post([
+            {'op': 'add', 'product': self.tea.pk, 'qty': 1},
+            {'op': 'add', 'product': self.soap.pk, 'qty': 3},
+        ], atomic=True)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.get_lines(), {})
+
+    def test_malformed_request(self):
+        response = self.client.post(reverse('webapp:cart_api'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post('add').status_code, 400)
+
+    @override_settings(CART_BACKEND='webapp.cart.SignedCookieCart')
+    def test_cookie_backend(self):
+        self.post([{'op': 'add', 'product': self.tea.pk, 'qty': 2}])
+        self.assertEqual(self.get_lines(), {self.tea.pk: 2})
+
+
+class MediaViewTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        with open(os.path.join(self.root, 'file.txt'), 'wb') as file:
+            file.write(b'0123456789')
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = '/media/file.txt'
+
+    def get(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def test_full_response_has_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+    def test_not_modified(self):
+        first = self.get()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_byte_ranges(self):
+        for header, content_range, content in [
+            ('bytes=0-3', 'bytes 0-3/10', b'0123'),
+            ('bytes=7-', 'bytes 7-9/10', b'789'),
+            ('bytes=8-100', 'bytes 8-9/10', b'89'),
+            ('bytes=-3', 'bytes 7-9/10', b'789'),
+            ('bytes=-100', 'bytes 0-9/10', b'0123456789'),
+        ]:
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(b''.join(response.streaming_content), content)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=-0', 'bytes=10-', 'bytes=5-2'):
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag).status_code, 206)
+        # файл изменился с тех пор, как клиент скачал начало: отдаём целиком
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_outside_media_root(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/missing.txt').status_code, 404)
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.tea = Product.objects.create(name='Зелёный чай', description='Листовой', amount=1, price=10)
+
+    def search(self, value):
+        return list(product_search_index.search(Product.objects.all(), value))
+
+    def test_index_follows_save_update_and_delete(self):
+        self.assertEqual(self.search('зелёный'), [self.tea])
+        self.tea.name = 'Чёрный чай'
+        self.tea.save()
+        self.assertEqual(self.search('зелёный'), [])
+        Product.objects.filter(pk=self.tea.pk).update(description='Пакетированный')
+        self.assertEqual(self.search('пакет'), [self.tea])
+        self.assertEqual(self.search('листовой'), [])
+        self.tea.delete()
+        self.assertEqual(self.search('чай'), [])
+
+    def test_words_are_prefix_terms_joined_by_and(self):
+        self.assertEqual(self.search('зел ча'), [self.tea])
+        self.assertEqual(self.search('зелёный кофе'), [])
+        # операторы FTS5 в запросе пользователя не ломают MATCH
+        self.assertEqual(self.search('"чай"*) ('), [self.tea])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_ranking(self):
+        herbal = Product.objects.create(name='Травяной сбор', description='Можно заваривать как чай',
+                                        amount=1, price=10)
+        green = Product.objects.create(name='Чай', description='Чай зелёный, чай байховый', amount=1, price=10)
+        self.assertEqual(self.search('чай'), [green, self.tea, herbal])
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # много одинаковых (category, name): порядок между ними задаёт только pk
+        for i in range(13):
+            Product.objects.create(name='Чай' if i % 3 else 'Мыло', category='food' if i % 2 else 'household',
+                                   amount=1, price=10)
+        self.expected = list(Product.objects.order_by('category', 'name', 'pk').values_list('pk', flat=True))
+
+    def get_page(self, cursor=None):
+        response = self.client.get(reverse('webapp:index'), {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_forward_paging_covers_every_row_once(self):
+        seen, pages, page = [], [], self.get_page()
+        while True:
+            pages.append(page)
+            seen += [product.pk for product in page]
+            if not page.has_next():
+                break
+            page = self.get_page(page.next_cursor)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 3])
+        self.assertFalse(pages[0].has_previous())
+
+    def test_previous_cursor(self):
+        first = self.get_page()
+        second = self.get_page(first.next_cursor)
+        third = self.get_page(second.next_cursor)
+        back = self.get_page(third.previous_cursor)
+        self.assertEqual([product.pk for product in back], [product.pk for product in second])
+        self.assertTrue(back.has_next())
+        self.assertEqual([product.pk for product in self.get_page(back.previous_cursor)],
+                         [product.pk for product in first])
+
+    def test_last_page_cursor(self):
+        last = self.get_page(self.get_page().last_cursor)
+        self.assertEqual([product.pk for product in last], self.expected[-5:])
+        self.assertFalse(last.has_next())
+
+    def test_tampered_cursor_is_404(self):
+        cursor = self.get_page().next_cursor
+        self.assertEqual(self.client.get(reverse('webapp:index'), {'cursor': cursor[:-2]}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('webapp:index'), {'cursor': 'garbage'}).status_code, 404)
+
+
+class PageCacheTest(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+
+    def get_index(self, client=None):
+        response = (client or self.client).get(reverse('webapp:index'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def is_cached(self, response):
+        return 'product/index.html' not in [template.name for template in response.templates]
+
+    def test_anonymous_page_is_served_from_cache(self):
+        self.assertFalse(self.is_cached(self.get_index()))
+        self.assertTrue(self.is_cached(self.get_index()))
+
+    def test_product_change_bumps_catalog_version(self):
+        self.get_index()
+        version = get_catalog_version()
+        self.tea.name = 'Кофе'
+        self.tea.save()
+        self.assertGreater(get_catalog_version(), version)
+        response = self.get_index()
+        self.assertFalse(self.is_cached(response))
+        self.assertContains(response, 'Кофе')
+
+    def test_placeholders_are_filled_per_visitor(self):
+        self.get_index()
+        visitor = Client(enforce_csrf_checks=True)
+        response = self.get_index(visitor)
+        self.assertTrue(self.is_cached(response))
+        self.assertNotIn(CSRF_PLACEHOLDER, response.content.decode())
+        # токен со страницы из кэша принимается CsrfViewMiddleware этого посетителя
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        response = visitor.post(reverse('webapp:product_add_to_cart', kwargs={'pk': self.tea.pk}),
+                                {'qty': 2, 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+        response = self.get_index(visitor)
+        self.assertTrue(self.is_cached(response))
+        self.assertNotIn(CART_BADGE_PLACEHOLDER, response.content.decode())
+        self.assertContains(response, '(2 шт.')
+        self.assertNotContains(self.get_index(), 'шт.')
+
+    def test_authenticated_requests_skip_cache(self):
+        self.client.force_login(get_user_model().objects.create_user('user', password='secret'))
+        self.get_index()
+        self.assertFalse(self.is_cached(self.get_index()))
+
+    def test_process_local_cache_disables_page_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.get_index()
+            self.assertFalse(self.is_cached(self.get_index()))
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', category='food', amount=5, price=10)
+        self.coffee = Product.objects.create(name='Кофе', category='food', amount=0, price=20)
+        self.soap = Product.objects.create(name='Мыло', category='household', amount=0, price=3)
+
+    def get_index(self, **params):
+        response = self.client.get(reverse('webapp:index'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def get_names(self, response):
+        return sorted(product.name for product in response.context['products'])
+
+    def test_default_lists_all_products(self):
+        self.assertEqual(self.get_names(self.get_index()), ['Кофе', 'Мыло', 'Чай'])
+
+    def test_filters(self):
+        self.assertEqual(self.get_names(self.get_index(stock='in')), ['Чай'])
+        self.assertEqual(self.get_names(self.get_index(category='food')), ['Кофе', 'Чай'])
+        self.assertEqual(self.get_names(self.get_index(category='household', stock='in')), [])
+
+    def test_invalid_field_keeps_other_facets(self):
+        response = self.get_index(category='nonsense', stock='in')
+        self.assertEqual(self.get_names(response), ['Чай'])
+        self.assertEqual(self.get_names(self.get_index(category='food', stock='nonsense')), ['Кофе', 'Чай'])
+
+    def test_counts(self):
+        facets = self.get_index(stock='in').context['facets']
+        categories = {facet['value']: facet['count'] for facet in facets.categories}
+        # пустые при выбранном наличии категории скрыты
+        self.assertEqual(categories, {'': 1, 'food': 1})
+        stock = {facet['value']: facet['count'] for facet in facets.stock_choices}
+        self.assertEqual(stock, {'': 3, 'in': 1})
+        facets = self.get_index(category='food').context['facets']
+        self.assertEqual({facet['value']: facet['count'] for facet in facets.categories},
+                         {'': 3, 'food': 2, 'household': 1})
+        self.assertEqual({facet['value']: facet['count'] for facet in facets.stock_choices}, {'': 2, 'in': 1})
+
+    def test_counts_follow_search(self):
+        facets = self.get_index(search='чай').context['facets']
+        self.assertEqual({facet['value']: facet['count'] for facet in facets.stock_choices}, {'': 1, 'in': 1})
+
+
+class SharedFacetCacheTest(SharedCacheMixin, FacetTest):
+    def test_cached_counts_follow_product_changes(self):
+        self.get_index()
+        self.tea.amount = 0
+        self.tea.save()
+        facets = self.get_index().context['facets']
+        self.assertEqual({facet['value']: facet['count'] for facet in facets.stock_choices}, {'': 3, 'in': 0})
+
+
+@override_settings(SESSION_ENGINE='webapp.session_backend', SESSION_ACTIVITY_INTERVAL=300)
+class SessionBackendTest(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # TestCase не коммитит транзакцию, поэтому on_commit вызывается сразу
+        on_commit = mock.patch.object(session_backend.transaction, 'on_commit',
+                                      side_effect=lambda func, using=None: func())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+        store = session_backend.SessionStore()
+        store['user'] = 'first'
+        store.save()
+        self.session_key = store.session_key
+
+    def load(self):
+        store = session_backend.SessionStore(self.session_key)
+        store.load()
+        return store
+
+    def get_cached(self):
+        return cache.get(session_backend.CACHE_KEY_PREFIX + self.session_key)
+
+    def test_cache_settings_from_environment(self):
+        self.assertFalse(is_shared_cache_config(get_caches({})['default']))
+        caches = get_caches({'CACHE_BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                             'CACHE_LOCATION': '127.0.0.1:11211'})
+        self.assertEqual(caches['default']['LOCATION'], '127.0.0.1:11211')
+        self.assertTrue(is_shared_cache_config(caches['default']))
+
+    def test_session_is_read_from_cache(self):
+        self.assertEqual(self.get_cached()[0], session_backend.WRITE_MARKER)
+        self.assertEqual(self.load()['user'], 'first')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.load()['user'], 'first')
+
+    def test_write_replaces_cached_copy_with_marker(self):
+        self.load()
+        store = self.load()
+        store['user'] = 'second'
+        store.save()
+        self.assertEqual(self.get_cached()[0], session_backend.WRITE_MARKER)
+        self.assertEqual(self.load()['user'], 'second')
+        self.assertNotEqual(self.get_cached()[0], session_backend.WRITE_MARKER)
+
+    def test_reader_started_before_write_does_not_fill_cache(self):
+        cache.set(session_backend.CACHE_KEY_PREFIX + self.session_key,
+                  (session_backend.WRITE_MARKER, time.time() + 60))
+        self.assertEqual(self.load()['user'], 'first')
+        self.assertEqual(self.get_cached()[0], session_backend.WRITE_MARKER)
+
+    def test_activity_is_saved_once_per_interval(self):
+        store = self.load()
+        self.assertTrue(store.modified)
+        store.save()
+        store = self.load()
+        self.assertFalse(store.modified)
+        with self.assertNumQueries(0):
+            store.save()
+        with mock.patch.object(session_backend.time, 'time', return_value=time.time() + 301):
+            self.assertTrue(self.load().modified)
+
+    def test_delete_invalidates_cached_session(self):
+        self.load()
+        store = self.load()
+        store.delete()
+        self.assertFalse(store.exists(self.session_key))
+        self.assertEqual(dict(self.load().items()), {})
+
+
+class ConditionalPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+
+    def get_index(self, **headers):
+        return self.client.get(reverse('webapp:index'), **headers)
+
+    def test_not_modified(self):
+        response = self.get_index()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        response = self.get_index(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_cart_change_changes_etag(self):
+        etag = self.get_index()['ETag']
+        self.client.post(reverse('webapp:product_add_to_cart', kwargs={'pk': self.tea.pk}), {'qty': 1})
+        response = self.get_index(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_login_changes_etag(self):
+        etag = self.get_index()['ETag']
+        self.client.force_login(get_user_model().objects.create_user('user', password='secret'))
+        response = self.get_index(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_queryset_update_moves_last_modified(self):
+        first = self.get_index()
+        later = timezone.now() + timedelta(minutes=2)
+        with mock.patch.object(timezone, 'now', return_value=later):
+            Product.objects.filter(pk=self.tea.pk).update(price=12)
+        response = self.get_index(HTTP_IF_NONE_MATCH=first['ETag'], HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(first['Last-Modified']))
+        self.assertEqual(self.get_index(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+
+class StockShardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', amount=10, price=10)
+        StockShard.rebalance(self.tea.pk, shards=4)
+
+    def get_shards(self):
+        return sorted(StockShard.objects.filter(product=self.tea).values_list('amount', flat=True))
+
+    def get_amount(self):
+        return Product.objects.get(pk=self.tea.pk).amount
+
+    def test_rebalance(self):
+        self.assertEqual(self.get_shards(), [2, 2, 3, 3])
+        self.assertEqual(Product.objects.get(pk=self.tea.pk).stock_shards, 4)
+        StockShard.rebalance(self.tea.pk, amount=21)
+        self.assertEqual(self.get_shards(), [5, 5, 5, 6])
+        self.assertEqual(self.get_amount(), 21)
+        StockShard.rebalance(self.tea.pk, shards=0)
+        self.assertEqual(self.get_shards(), [])
+        self.assertEqual((self.get_amount(), Product.objects.get(pk=self.tea.pk).stock_shards), (21, 0))
+
+    def test_take(self):
+        self.assertEqual(StockShard.take(self.tea.pk, 2), 8)
+        self.assertEqual(sum(self.get_shards()), 8)
+        # больше, чем в любом слоте: собирается из нескольких
+        self.assertEqual(StockShard.take(self.tea.pk, 7), 1)
+        self.assertEqual(sum(self.get_shards()), 1)
+        self.assertIsNone(StockShard.take(self.tea.pk, 2))
+        self.assertEqual(sum(self.get_shards()), 1)
+
+    def test_sync_amounts(self):
+        soap = Product.objects.create(name='Мыло', amount=3, price=3)
+        StockShard.take(self.tea.pk, 4)
+        Product.objects.sync_amounts()
+        self.assertEqual(self.get_amount(), 6)
+        self.assertEqual(Product.objects.get(pk=soap.pk).amount, 3)
+
+    def test_takes_inside_sync_window_are_synced_later(self):
+        timers = []
+        with mock.patch('webapp.models.transaction.on_commit', side_effect=lambda func, using=None: func()), \
+                mock.patch('webapp.models.threading.Timer', side_effect=lambda delay, func: timers.append(func) or mock.Mock()):
+            self.assertEqual(Product.objects.decrement_stock({self.tea.pk: 1}), {self.tea.pk})
+            self.assertEqual(self.get_amount(), 9)
+            Product.objects.decrement_stock({self.tea.pk: 2})
+            Product.objects.decrement_stock({self.tea.pk: 1})
+        # второе и третье списания ждут конца окна, поток запланирован один раз
+        self.assertEqual(self.get_amount(), 9)
+        self.assertEqual(len(timers), 1)
+        timers[0]()
+        self.assertEqual(self.get_amount(), 6)
+
+
+class ProductFormTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(name='Чай', category='food', amount=10, price=10)
+        user = get_user_model().objects.create_user('manager', password='secret')
+        user.user_permissions.add(Permission.objects.get(codename='change_product'))
+        self.client.force_login(user)
+        self.url = reverse('webapp:product_update', kwargs={'pk': self.tea.pk})
+
+    def open_form(self):
+        # данные формы в том виде, в каком их отправит браузер
+        response = self.client.get(self.url)
+        form = response.context['form']
+        data = {name: form[name].value() for name in form.fields if form[name].value() is not None}
+        data['initial-amount'] = form['amount'].value()
+        self.assertContains(response, 'name="initial-amount" value="10"')
+        return data
+
+    def submit(self, data, **changes):
+        response = self.client.post(self.url, dict(data, **changes))
+        self.assertEqual(response.status_code, 302)
+        self.tea.refresh_from_db()
+
+    def test_stale_form_keeps_checkouts(self):
+        data = self.open_form()
+        Product.objects.decrement_stock({self.tea.pk: 1})
+        self.submit(data, name='Зелёный чай')
+        self.assertEqual((self.tea.name, self.tea.amount), ('Зелёный чай', 9))
+
+    def test_amount_change_is_applied_as_delta(self):
+        data = self.open_form()
+        Product.objects.decrement_stock({self.tea.pk: 1})
+        self.submit(data, amount=15)
+        self.assertEqual(self.tea.amount, 14)
+
+    def test_sharded_product(self):
+        StockShard.rebalance(self.tea.pk, shards=2)
+        data = self.open_form()
+        StockShard.take(self.tea.pk, 3)
+        Product.objects.sync_amounts([self.tea.pk])
+        self.submit(data, amount=12)
+        self.assertEqual(self.tea.amount, 9)
+        self.assertEqual(sum(StockShard.objects.filter(product=self.tea).values_list('amount', flat=True)), 9)
+        self.assertEqual(self.tea.stock_shards, 2)
+
+    def test_create(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.post(reverse('webapp:product_create'), {
+            'name': 'Кофе', 'category': 'food', 'amount': 4, 'price': 20, 'initial-amount': ''})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.get(name='Кофе').amount, 4)
+
+
+class ImportProductsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tea = Product.objects.create(sku='TEA', name='Чай', category='food', amount=10, price=10)
+        self.soap = Product.objects.create(name='Мыло', category='household', amount=5, price=3)
+
+    def import_csv(self, text):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write('id,sku,name,description,category,amount,price\n' + text)
+        call_command('import_products', path, stdout=StringIO(), stderr=StringIO())
+
+    def get_shards_total(self, product):
+        return sum(StockShard.objects.filter(product=product).values_list('amount', flat=True))
+
+    def test_create_and_update(self):
+        self.import_csv(f',TEA,Чай,,food,7,12\n,COFFEE,Кофе,,food,3,20\n{self.soap.pk},,Мыло,,household,6,3\n')
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('name', 'amount', 'price')),
+                         [('Чай', 7, 12), ('Мыло', 6, 3), ('Кофе', 3, 20)])
+
+    def test_sharded_amount_goes_to_shards(self):
+        StockShard.rebalance(self.tea.pk, shards=2)
+        StockShard.rebalance(self.soap.pk, shards=2)
+        self.import_csv(f',TEA,Чай,,food,20,10\n{self.soap.pk},,Мыло,,household,8,3\n')
+        Product.objects.sync_amounts()
+        for product, amount in ((self.tea, 20), (self.soap, 8)):
+            product.refresh_from_db()
+            self.assertEqual((product.amount, self.get_shards_total(product), product.stock_shards), (amount, amount, 2))
+
+    def test_unchanged_sharded_amount_keeps_shards(self):
+        StockShard.rebalance(self.tea.pk, shards=2)
+        shards = list(StockShard.objects.filter(product=self.tea).values_list('pk', flat=True))
+        self.import_csv(',TEA,Зелёный чай,,food,10,10\n')
+        self.assertEqual(list(StockShard.objects.filter(product=self.tea).values_list('pk', flat=True)), shards)
+        self.assertEqual(Product.objects.get(pk=self.tea.pk).name, 'Зелёный чай')
+
+
+class HousekeepingTest(TestCase):
+    def setUp(self):
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+        past, future = timezone.now() - timedelta(days=1), timezone.now() + timedelta(days=1)
+        for i in range(5):
+            session = Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=past)
+            Cart.objects.create(product=self.tea, session=session)
+        for i in range(2):
+            session = Session.objects.create(session_key=f'live{i}', session_data='', expire_date=future)
+            Cart.objects.create(product=self.tea, session=session)
+        Cart.objects.create(product=self.tea, session=None)
+        user = get_user_model().objects.create_user('user', password='secret')
+        for life_days, age in ((7, 8), (7, 6), (1, 2), (30, 10)):
+            token = AuthToken.objects.create(user=user, life_days=life_days)
+            AuthToken.objects.filter(pk=token.pk).update(created_at=timezone.now() - timedelta(days=age))
+
+    def test_pk_ranges(self):
+        pks = list(Session.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(list(housekeeping.pk_ranges(Session, 3)), [(None, pks[2]), (pks[2], pks[5]), (pks[5], pks[6])])
+        self.assertEqual(list(housekeeping.pk_ranges(Session, 7)), [(None, pks[6])])
+        self.assertEqual(list(housekeeping.pk_ranges(Session, 100)), [(None, pks[6])])
+        Session.objects.all().delete()
+        self.assertEqual(list(housekeeping.pk_ranges(Session, 3)), [])
+
+    def test_deletes_only_expired_rows_in_chunks(self):
+        logged = []
+        deleted = housekeeping.delete_in_chunks(Session, housekeeping.expired_sessions, chunk_size=2,
+                                                log=logged.append)
+        self.assertEqual(deleted, {'sessions.Session': 5, 'webapp.Cart': 5})
+        # ключи expired* идут раньше live*: три диапазона с удалёнными строками, один без
+        self.assertEqual(len(logged), 3)
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), ['live0', 'live1'])
+
+    def test_run_reports_counts_per_task(self):
+        results = {name: deleted for name, deleted, elapsed in housekeeping.run(chunk_size=3)}
+        self.assertEqual(results['sessions'], {'sessions.Session': 5, 'webapp.Cart': 5})
+        self.assertEqual(results['carts'], {'webapp.Cart': 1})
+        self.assertEqual(results['tokens'], {'accounts.AuthToken': 2})
+        self.assertEqual(Cart.objects.count(), 2)
+        self.assertEqual(sorted(AuthToken.objects.values_list('life_days', flat=True)), [7, 30])
+        self.assertEqual(housekeeping.run(chunk_size=3)[0][1], {})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('housekeeping', 'tokens', stdout=out)
+        self.assertIn('tokens: accounts.AuthToken: 2', out.getvalue())
+
+
+class ProductCacheTest(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        product_cache.local.clear()
+        self.tea = Product.objects.create(name='Чай', amount=5, price=10)
+        self.soap = Product.objects.create(name='Мыло', amount=2, price=3)
+        # прогреваем оба уровня
+        product_cache.get_many([self.tea.pk, self.soap.pk])
+
+    def test_cached_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(product_cache.get(self.tea.pk).price, 10)
+
+    def test_invalidated_on_save(self):
+        self.tea.price = 12
+        self.tea.save()
+        self.assertEqual(product_cache.get(self.tea.pk).price, 12)
+
+    def test_invalidated_on_update(self):
+        Product.objects.filter(pk=self.tea.pk).update(price=15)
+        self.assertEqual(product_cache.get(self.tea.pk).price, 15)
+        self.assertEqual(product_cache.get(self.soap.pk).price, 3)
+
+    def test_invalidated_on_bulk_update(self):
+        self.tea.price, self.soap.price = 11, 4
+        Product.objects.bulk_update([self.tea, self.soap], ['price'])
+        products = product_cache.get_many([self.tea.pk, self.soap.pk])
+        self.assertEqual((products[self.tea.pk].price, products[self.soap.pk].price), (11, 4))
+
+    def test_invalidated_on_delete(self):
+        self.soap.delete()
+        self.assertIsNone(product_cache.get(self.soap.pk))
+
+    def test_process_local_cache_reads_database(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            product_cache.get(self.tea.pk)
+            # в другом процессе invalidate не видна: запись меняется в обход кэша
+            with mock.patch.object(product_cache, 'invalidate'):
+                Product.objects.filter(pk=self.tea.pk).update(price=20)
+            with self.assertNumQueries(1):
+                self.assertEqual(product_cache.get(self.tea.pk).price, 20)
+
+    def test_order_price_read_from_database(self):
+        self.client.post(reverse('webapp:product_add_to_cart', kwargs={'pk': self.tea.pk}), {'qty': 1})
+        # цена изменилась, а кэш ещё отдаёт старую (invalidate не дошла)
+        with mock.patch.object(product_cache, 'invalidate'):
+            Product.objects.filter(pk=self.tea.pk).update(price=14)
+        self.assertEqual(product_cache.get(self.tea.pk).price, 10)
+        self.client.post(reverse('webapp:order_create'), ORDER_DATA)
+        self.assertEqual(OrderProduct.objects.get().price, 14)
@@ -21,6 +21,7 @@ urlpatterns = [
 
     path('cart/', include([
         path('', CartView.as_view(), name='cart_view'),
+        path('api/', CartApiView.as_view(), name='cart_api'),
         path('<int:pk>/', include([
             path('delete/', CartDeleteView.as_view(), name='cart_delete'),
             path('delete-one/', CartDeleteOneView.as_view(), name='cart_delete_one'),
@@ -28,5 +29,6 @@ urlpatterns = [
     ])),
 
     path('order/create/', OrderCreateView.as_view(), name='order_create'),
-    path('orders/watch/', WatchOrdersView.as_view(), name='watch_orders')
+    path('orders/watch/', WatchOrdersView.as_view(), name='watch_orders'),
+    path('perf/', PerfStatsView.as_view(), name='perf_stats')
 ]
@@ -1,2 +1,4 @@
 from .product_views import *
 from .order_views import *
+from .media_views import *
+from .perf_views import *
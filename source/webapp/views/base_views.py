@@ -1,13 +1,130 @@
+import hashlib
+
+from django.contrib.messages import get_messages
 from django.db.models import Q
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.generic import ListView as DjangoListView
 
+from webapp.cache import get_placeholder_context, get_page_cache_key, get_cached_page, is_cache_shared, \
+    set_cached_page
+from webapp.db import read_from_primary
 from webapp.forms import SimpleSearchForm
+from webapp.pagination import CursorPaginator, InvalidCursor, COUNT_ESTIMATE
+
+
+class ConditionalPageMixin:
+    """
+    Ответ 304 Not Modified по If-None-Match / If-Modified-Since до выборки
+    и рендера страницы. Наследник задаёт get_last_modified (datetime или секунды)
+    и get_etag_parts; к ним добавляются адрес страницы и всё, что на ней зависит
+    от посетителя: пользователь и сводка корзины.
+    """
+
+    def get_last_modified(self):
+        return None
+
+    def get_etag_parts(self):
+        return []
+
+    def get_conditional_validators(self, request):
+        last_modified = self.get_last_modified()
+        if last_modified is None:
+            return None, None
+        if not isinstance(last_modified, (int, float)):
+            last_modified = last_modified.timestamp()
+        summary = request.cart.summary
+        parts = [request.get_full_path(), last_modified, request.user.pk or 0, summary['count'], summary['total']]
+        parts += self.get_etag_parts()
+        digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+        return quote_etag(digest), int(last_modified)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_conditional_validators(request)
+        if etag is None:
+            return super().dispatch(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # на странице CSRF-токен и корзина посетителя: общим кэшам её хранить нельзя
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class AnonymousPageCacheMixin:
+    page_cache_timeout = 60 * 10
+
+    def is_page_cacheable(self, request):
+        # в кэш попадают только страницы без состояния посетителя. С кэшем в памяти
+        # процесса версию каталога не поднять в остальных процессах, и они
+        # отдавали бы старые страницы, поэтому такой кэш страниц не хранит
+        if not is_cache_shared():
+            return False
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if request.user.is_authenticated:
+            return False
+        return not len(get_messages(request))
+
+    def dispatch(self, request, *args, **kwargs):
+        self.page_cache_key = None
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        self.page_cache_key = get_page_cache_key(request)
+        response = get_cached_page(request, self.page_cache_key)
+        if response is not None:
+            return response
+        # страница уйдёт в общий кэш, поэтому собирается по данным default
+        read_from_primary()
+        response = super().dispatch(request, *args, **kwargs)
+        if not hasattr(response, 'render'):
+            return response
+        # рендер остаётся за обработчиком запроса (и попадает в замер шаблона),
+        # страница кладётся в кэш сразу после него
+        key = self.page_cache_key
+        response.add_post_render_callback(
+            lambda response: set_cached_page(request, key, response, self.page_cache_timeout))
+        return response
+
+    def get_context_data(self, **kwargs):
+        if self.page_cache_key:
+            for key, value in get_placeholder_context().items():
+                kwargs.setdefault(key, value)
+        return super().get_context_data(**kwargs)
+
+
+class CursorPaginationMixin:
+    cursor_ordering = None
+    cursor_query_param = 'cursor'
+    cursor_count_mode = COUNT_ESTIMATE
+
+    def use_cursor_pagination(self):
+        return bool(self.cursor_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering,
+                                    count_mode=self.cursor_count_mode)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_query_param))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
 
 
 class SearchView(DjangoListView):
     search_form_class = SimpleSearchForm
     search_form_field = 'search'
     search_fields = []
+    search_index = None
+    search_ranked = True
 
     def get(self, request, *args, **kwargs):
         self.search_form = self.get_search_form()
@@ -22,6 +139,10 @@ class SearchView(DjangoListView):
 
     def get_queryset(self):
         data = super(SearchView, self).get_queryset()
+        if self.search_index is not None:
+            if self.search_value:
+                data = self.search_index.search(data, self.search_value, ranked=self.search_ranked)
+            return data
         query = self.get_query(self.search_value)
         data = data.filter(query)
         return data
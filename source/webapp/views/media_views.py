@@ -0,0 +1,136 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.generic import View
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+HASHED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{16}_\w+\.\w+$')
+
+
+class RangeFile:
+    # Отдаёт из файла только length байт начиная с offset. fileno() оставлен:
+    # WSGI-сервер с wsgi.file_wrapper (gunicorn) отправит диапазон через
+    # os.sendfile без копирования в Python, ограничившись Content-Length.
+
+    def __init__(self, file, offset, length):
+        self.file = file
+        self.remaining = length
+        file.seek(offset)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class MediaView(View):
+    """
+    Раздача MEDIA_ROOT без DEBUG: ETag/Last-Modified с ответом 304, Range-запросы,
+    долгий кэш для имён с хэшем содержимого. Если задан MEDIA_ACCEL_REDIRECT,
+    сам файл отдаёт фронтовой сервер по заголовку X-Accel-Redirect.
+    """
+    document_root = None
+    hashed_max_age = 60 * 60 * 24 * 365
+    max_age = 60 * 60
+    block_size = 64 * 1024
+
+    def get(self, request, path):
+        root = self.document_root or settings.MEDIA_ROOT
+        try:
+            full_path = safe_join(root, path)
+        except (ValueError, SuspiciousFileOperation):
+            raise Http404('Файл не найден')
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            raise Http404('Файл не найден')
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise Http404('Файл не найден')
+
+        etag = quote_etag(f'{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}')
+        last_modified = int(stat_result.st_mtime)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_file_response(request, path, full_path, stat_result.st_size, etag, last_modified)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = self.get_cache_control(path)
+        return response
+
+    def get_cache_control(self, path):
+        if HASHED_NAME_RE.search(path):
+            return f'public, max-age={self.hashed_max_age}, immutable'
+        return f'public, max-age={self.max_age}'
+
+    def get_range(self, request, size, etag, last_modified):
+        header = request.META.get('HTTP_RANGE')
+        if not header:
+            return None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+            return None
+        match = RANGE_RE.match(header.strip())
+        if not match:
+            return None
+        start, end = match.groups()
+        if not start:
+            if not end:
+                return None
+            length = min(int(end), size)
+            if not length:
+                # bytes=-0 (или пустой файл): ни одного байта отдать нельзя
+                return False
+            return size - length, size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        if start > end:
+            return False
+        return start, end
+
+    def get_file_response(self, request, path, full_path, size, etag, last_modified):
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        byte_range = self.get_range(request, size, etag, last_modified)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+        if accel_prefix:
+            # диапазоны и отдачу с диска берёт на себя nginx
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + path.lstrip('/')
+            return response
+
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = FileResponse(RangeFile(file, start, end - start + 1), content_type=content_type, status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.block_size = self.block_size
+        response['Accept-Ranges'] = 'bytes'
+        return response
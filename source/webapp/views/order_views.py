@@ -1,12 +1,21 @@
+import json
+from datetime import datetime, time, timedelta
+
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
-from django.contrib.sessions.models import Session
-from django.shortcuts import get_object_or_404, redirect
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
 from django.urls import reverse, reverse_lazy
-from django.views.generic import ListView, CreateView, DeleteView
+from django.utils.timezone import localdate, make_aware
+from django.views.generic import View, ListView, CreateView, DeleteView
 
-from webapp.forms import CartAddForm, OrderForm
-from webapp.models import Cart, Product, Order, OrderProduct
+from webapp.forms import CartAddForm, OrderForm, OrderFilterForm
+from webapp.models import Cart, Product, Order, OrderProduct, DailyProductSales, DailyCategorySales
+from webapp.product_cache import product_cache
+from .base_views import CursorPaginationMixin
 
 
 class CartView(ListView):
@@ -14,16 +23,13 @@ class CartView(ListView):
     context_object_name = 'cart'
 
     def get_queryset(self):
-        return Cart.get_with_product()
+        return self.request.cart.lines
 
     def get_context_data(self, *, object_list=None, **kwargs):
-        if not self.request.session.session_key:
-            self.request.session.save()
-        session = Session.objects.get(session_key=self.request.session.session_key)
         context = super().get_context_data(object_list=object_list, **kwargs)
-        context['cart_total'] = Cart.get_cart_total(session=session)
+        context['cart_total'] = self.request.cart.total
         context['form'] = OrderForm()
-        context['cart'] = context['cart'].filter(session=session)
+        self.request.cart.refresh_summary()
         return context
 
 
@@ -32,22 +38,12 @@ class CartAddView(CreateView):
     form_class = CartAddForm
 
     def post(self, request, *args, **kwargs):
-        self.product = get_object_or_404(Product, pk=self.kwargs.get('pk'))
+        self.product = product_cache.get_or_404(self.kwargs.get('pk'))
         return super().post(request, *args, **kwargs)
 
     def form_valid(self, form):
         qty = form.cleaned_data.get('qty', 1)
-        if not self.request.session.session_key:
-            self.request.session.save()
-        session = Session.objects.get(session_key=self.request.session.session_key)
-        try:
-            cart_product = Cart.objects.get(product=self.product, session=session)
-            cart_product.qty += qty
-            if cart_product.qty <= self.product.amount:
-                cart_product.save()
-        except Cart.DoesNotExist:
-            if qty <= self.product.amount:
-                Cart.objects.create(product=self.product, qty=qty, session=session)
+        self.request.cart.add(self.product, qty)
         return redirect(self.get_success_url())
 
     def form_invalid(self, form):
@@ -60,32 +56,65 @@ class CartAddView(CreateView):
         return reverse('webapp:index')
 
 
-class CartDeleteView(DeleteView):
-    model = Cart
+class CartLineMixin:
     success_url = reverse_lazy('webapp:cart_view')
 
+    def get_object(self, queryset=None):
+        # удалить можно только строку своей корзины
+        line = self.request.cart.get_line(self.kwargs.get('pk'))
+        if line is None:
+            raise Http404('Товара нет в корзине')
+        return line
+
+
+class CartDeleteView(CartLineMixin, DeleteView):
+    model = Cart
+
     def get(self, request, *args, **kwargs):
         return self.delete(request, *args, **kwargs)
 
+    def delete(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        self.request.cart.remove(self.object)
+        return redirect(self.get_success_url())
 
-class CartDeleteOneView(DeleteView):
+
+class CartDeleteOneView(CartLineMixin, DeleteView):
     model = Cart
-    success_url = reverse_lazy('webapp:cart_view')
 
     def get(self, request, *args, **kwargs):
         return self.delete(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
         self.object = self.get_object()
-        success_url = self.get_success_url()
+        self.request.cart.remove_one(self.object)
+        return redirect(self.get_success_url())
 
-        self.object.qty -= 1
-        if self.object.qty < 1:
-            self.object.delete()
-        else:
-            self.object.save()
 
-        return redirect(success_url)
+class CartApiView(View):
+    # {"operations": [{"op": "add" | "set" | "remove", "product": <pk>, "qty": <n>}, ...], "atomic": false}
+    # Неверные операции пропускаются и возвращаются в errors; при "atomic": true
+    # любая ошибка отменяет весь пакет.
+    max_operations = 200
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(request.cart.as_json())
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            operations = data['operations']
+        except (ValueError, UnicodeDecodeError, TypeError, KeyError):
+            return JsonResponse({'error': 'Ожидается JSON с ключом operations'}, status=400)
+        if not isinstance(operations, list) or len(operations) > self.max_operations:
+            return JsonResponse({'error': f'operations — список не длиннее {self.max_operations}'}, status=400)
+        cart = request.cart
+        with transaction.atomic():
+            quantities, products, errors = cart.plan(operations)
+            if errors and data.get('atomic'):
+                return JsonResponse({'errors': errors, **cart.as_json()}, status=409)
+            cart.set_quantities(quantities, products)
+        return JsonResponse({'errors': errors, **cart.as_json()})
 
 
 class OrderCreateView(CreateView):
@@ -94,41 +123,72 @@ class OrderCreateView(CreateView):
     success_url = reverse_lazy('webapp:index')
 
     def form_valid(self, form):
-        response = super().form_valid(form)
-        order = self.object
-        try:
-            order.user = self.request.user
-        except ValueError:
-            order.user = None
-        order.save()
-        session = Session.objects.get(session_key=self.request.session.session_key)
-        cart_products = Cart.objects.filter(session=session)
-        products = []
-        order_products = []
-
-        for item in cart_products:
-            if item.product.amount >= item.qty:
-                product = item.product
-                qty = item.qty
-                product.amount -= qty
-                products.append(product)
-                order_product = OrderProduct(order=order, product=product, qty=qty)
-                order_products.append(order_product)
-        OrderProduct.objects.bulk_create(order_products)
-        Product.objects.bulk_update(products, ('amount',))
-        cart_products.delete()
+        if self.request.user.is_authenticated:
+            form.instance.user = self.request.user
+        cart = self.request.cart
+        with transaction.atomic():
+            cart_products = cart.lines
+            quantities = {}
+            products = {}
+            for item in cart_products:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.qty
+                products[item.product_id] = item.product
+            sharded = [pk for pk, product in products.items() if product.stock_shards]
+            filled = Product.objects.decrement_stock(quantities, sharded)
+            if not filled:
+                transaction.set_rollback(True)
+                messages.error(self.request, 'Не удалось оформить заказ: товара нет в наличии')
+                return redirect('webapp:cart_view')
+            response = super().form_valid(form)
+            # цена фиксируется на момент заказа: выручка не зависит от будущих правок товара.
+            # Корзина берёт товары из product_cache, поэтому цену читаем из базы
+            prices = dict(Product.objects.filter(pk__in=filled).values_list('pk', 'price'))
+            order_products = [OrderProduct(order=self.object, product=products[pk], qty=quantities[pk],
+                                           price=prices[pk])
+                              for pk in filled]
+            OrderProduct.objects.bulk_create(order_products)
+            day = localdate(self.object.created_at)
+            DailyProductSales.add_lines(order_products, day)
+            DailyCategorySales.add_lines(order_products, day)
+            cart.remove_products(filled)
+        unfilled = [item for item in cart_products if item.product_id not in filled]
+        if unfilled:
+            names = ', '.join(f'{item.product.name} ({item.qty})' for item in unfilled)
+            messages.warning(self.request, f'Недостаточно товара, позиции остались в корзине: {names}')
         return response
 
     def form_invalid(self, form):
         return redirect('webapp:cart_view')
 
 
-class WatchOrdersView(LoginRequiredMixin, ListView):
+class WatchOrdersView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Order
     template_name = 'order/orders_View.html'
     context_object_name = 'orders'
+    paginate_by = 10
+    cursor_ordering = ['-created_at', '-pk']
+    cursor_count_mode = None
+    use_replica = True
+
+    def get(self, request, *args, **kwargs):
+        self.filter_form = OrderFilterForm(data=request.GET)
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
         data = super().get_queryset()
         data = data.filter(user=self.request.user)
-        return data
+        if self.filter_form.is_valid():
+            date_from = self.filter_form.cleaned_data.get('date_from')
+            date_to = self.filter_form.cleaned_data.get('date_to')
+            # границы дня, а не created_at__date: так работает индекс по created_at
+            if date_from:
+                data = data.filter(created_at__gte=make_aware(datetime.combine(date_from, time.min)))
+            if date_to:
+                data = data.filter(created_at__lt=make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+        lines = OrderProduct.objects.select_related('product')
+        return data.prefetch_related(Prefetch('order_products', queryset=lines))
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(object_list=object_list, **kwargs)
+        context['filter_form'] = self.filter_form
+        return context
@@ -0,0 +1,20 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import JsonResponse
+from django.views.generic import View
+
+from webapp.perf import perf_stats
+from webapp.product_cache import product_cache
+
+
+class PerfStatsView(UserPassesTestMixin, View):
+    # ?minutes=5 — только последние пять минут
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        try:
+            minutes = int(request.GET.get('minutes', 0)) or None
+        except ValueError:
+            minutes = None
+        return JsonResponse({'views': perf_stats.collect(minutes), 'product_cache': product_cache.stats()})
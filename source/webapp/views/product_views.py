@@ -1,28 +1,97 @@
+from django.conf import settings
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.views.generic import DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse, reverse_lazy
 
-from .base_views import SearchView
+from .base_views import SearchView, CursorPaginationMixin, AnonymousPageCacheMixin, ConditionalPageMixin
 
+from webapp.cache import get_catalog_modified, get_catalog_version
 from webapp.models import Product
-from webapp.forms import ProductForm
+from webapp.product_cache import product_cache
+from webapp.facets import ProductFacets, get_facet_rows, get_cached_facet_rows
+from webapp.forms import ProductForm, ProductFacetForm
+from webapp.search import product_search_index
 
 
-class IndexView(SearchView):
+class IndexView(ConditionalPageMixin, AnonymousPageCacheMixin, CursorPaginationMixin, SearchView):
     model = Product
     template_name = 'product/index.html'
     ordering = ['category', 'name']
-    search_fields = ['name__icontains']
+    cursor_ordering = ['category', 'name', 'pk']
+    search_index = product_search_index
+    use_replica = True
     paginate_by = 5
+    paginate_by_choices = (5, 20, 50, 100)
     context_object_name = 'products'
 
-    def get_queryset(self):
-        return super().get_queryset().filter(amount__gt=0)
-
+    facet_form_class = ProductFacetForm
 
-class ProductView(DetailView):
+    def get_queryset(self):
+        # счётчики фасетов считаются по выдаче поиска до фильтров по фасетам
+        queryset = super().get_queryset()
+        self.facets = self.get_facets(queryset)
+        return self.facets.filter(queryset)
+
+    def get_facets(self, queryset):
+        form = self.facet_form_class(data=self.request.GET)
+        # cleaned_data остаётся и при ошибках, но только с верными полями:
+        # неверная категория не сбрасывает фильтр по наличию
+        form.is_valid()
+        data = form.cleaned_data
+        if self.search_value:
+            rows = get_facet_rows(queryset)
+        else:
+            rows = get_cached_facet_rows(queryset)
+        return ProductFacets(rows, data.get('category'), data.get('stock'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['facets'] = self.facets
+        context['product_cache_timeout'] = getattr(settings, 'PRODUCT_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+        context['per_page_choices'] = self.paginate_by_choices
+        context['per_page'] = self.get_paginate_by(None)
+        return context
+
+    def get_paginate_by(self, queryset):
+        # ?per_page= из разрешённых значений; крупные страницы дешевле за счёт кэша карточек
+        try:
+            per_page = int(self.request.GET.get('per_page', 0))
+        except ValueError:
+            per_page = 0
+        return per_page if per_page in self.paginate_by_choices else self.paginate_by
+
+    def get_last_modified(self):
+        # версия каталога учитывает и удаления, max(updated_at) из базы — правки,
+        # сделанные процессами с другим (локальным) кэшем
+        updated_at = Product.objects.last_modified()
+        catalog_modified = get_catalog_modified()
+        if updated_at is None:
+            return catalog_modified
+        return max(updated_at.timestamp(), catalog_modified)
+
+    def get_etag_parts(self):
+        return [get_catalog_version()]
+
+    def use_cursor_pagination(self):
+        # выдачу поиска упорядочивает rank, по нему ключом не пролистать
+        if self.search_value and self.search_index is not None and self.search_ranked:
+            return False
+        return super().use_cursor_pagination()
+
+
+class ProductView(ConditionalPageMixin, AnonymousPageCacheMixin, DetailView):
     model = Product
     template_name = 'product/product_view.html'
+    use_replica = True
+
+    def get_object(self, queryset=None):
+        # товар из кэша товаров; его же берёт проверка Last-Modified
+        if not hasattr(self, 'product'):
+            self.product = product_cache.get_or_404(self.kwargs.get('pk'))
+        return self.product
+
+    def get_last_modified(self):
+        return self.get_object().updated_at
 
     # чтоб товары, которых не осталось нельзя было и просмотреть
     # это можно добавить вместо model = Product в Detail, Update и Delete View.